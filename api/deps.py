@@ -0,0 +1,22 @@
+"""
+Dependencies shared by the API routers.
+
+Clients are built once and reused across requests; the database client draws its
+connections from the shared pool in db_client.
+"""
+
+from functools import lru_cache
+
+# Import from main project
+from crawler import WebCrawler
+from db_client import SupabaseClient
+
+@lru_cache(maxsize=1)
+def get_crawler() -> WebCrawler:
+    """Dependency returning a crawler shared across requests."""
+    return WebCrawler()
+
+@lru_cache(maxsize=1)
+def get_db_client() -> SupabaseClient:
+    """Dependency returning a database client shared across requests."""
+    return SupabaseClient()
@@ -0,0 +1,26 @@
+"""
+Error handling shared by the API routers.
+"""
+
+from functools import wraps
+from fastapi import HTTPException, status
+
+def catch_errors(prefix: str):
+    """Decorate an endpoint so unexpected errors become a 500 with the given prefix.
+    
+    HTTPExceptions raised by the endpoint pass through unchanged.
+    """
+    def decorator(endpoint):
+        @wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"{prefix}: {str(e)}"
+                )
+        return wrapper
+    return decorator
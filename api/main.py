@@ -1,50 +1,77 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 import os
 import sys
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from contextlib import asynccontextmanager
+import anyio
 import uvicorn
 from dotenv import load_dotenv
 
-# Add the parent directory to the path so we can import from the main project
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-
 # Import routers
 from api.routers import search, crawl, chat, sites, pages
 
 # Load environment variables
 load_dotenv()
 
+# Show the API's own info logs (e.g. crawl completions) next to uvicorn's, and
+# only warnings from libraries. Records go through a queue and are written to
+# stderr by a background thread, so logging never waits on the stream
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(levelname)s:     %(name)s - %(message)s"))
+_log_listener = QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+logging.getLogger().addHandler(QueueHandler(_log_queue))
+logging.getLogger("api").setLevel(os.getenv("LOG_LEVEL", "INFO"))
+
+logger = logging.getLogger(__name__)
+
 # Custom middleware to handle trailing slashes
-class TrailingSlashMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Remove trailing slash if present (except for root path)
-        if request.url.path != "/" and request.url.path.endswith("/"):
-            # Simply modify the request scope directly
-            path_without_slash = request.url.path.rstrip("/")
-            print(f"Removing trailing slash: {request.url.path} -> {path_without_slash}")
-            
-            # Modify the request path in the scope
-            request.scope["path"] = path_without_slash
-            request.scope["raw_path"] = path_without_slash.encode()
-            
-            # Update the URL in the scope to avoid redirect
-            if "url" in request.scope:
-                url_parts = list(request.scope["url"])
-                url_parts[2] = path_without_slash  # Update the path component
-                request.scope["url"] = tuple(url_parts)
+class TrailingSlashMiddleware:
+    """Pure ASGI middleware that strips trailing slashes from request paths.
+
+    Rewriting the scope before the router sees it avoids the 307 redirects
+    FastAPI would otherwise issue, without the per-request overhead of
+    BaseHTTPMiddleware.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path")
+        
+        # Fast path: non-HTTP scopes, the root path and paths without a trailing slash
+        if scope["type"] != "http" or not path or path == "/" or path[-1] != "/":
+            await self.app(scope, receive, send)
+            return
         
-        # Continue processing the request
-        response = await call_next(request)
+        # Remove the trailing slash
+        scope = dict(scope)
+        scope["path"] = path.rstrip("/") or "/"
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Removing trailing slash: %s -> %s", path, scope["path"])
+        raw_path = scope.get("raw_path")
+        if raw_path:
+            scope["raw_path"] = raw_path.rstrip(b"/") or b"/"
         
-        # Ensure we don't return 307 redirects for trailing slashes
-        if response.status_code == 307 and response.headers.get("location", "").endswith("/"):
-            print(f"Preventing 307 redirect for path: {request.url.path}")
-            # Create a new response with the same content but status code 200
-            return await call_next(request)
-            
-        return response
+        await self.app(scope, receive, send)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Blocking DB calls and sync dependencies run in the threadpool, so allow more than the default 40 threads
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(os.getenv("API_THREADPOOL_SIZE", "64"))
+    yield
+    # Don't start queued crawls while the worker is shutting down
+    await anyio.to_thread.run_sync(crawl.shutdown_crawls)
 
 # Create FastAPI app
 app = FastAPI(
@@ -53,11 +80,17 @@ app = FastAPI(
     version="1.0.0",
     # Disable automatic redirection for trailing slashes since we handle it in middleware
     redirect_slashes=False,
+    lifespan=lifespan,
+    # orjson serializes the large page and search result lists much faster than json
+    default_response_class=ORJSONResponse,
 )
 
 # Add trailing slash middleware first
 app.add_middleware(TrailingSlashMiddleware)
 
+# Compress larger responses such as chat history; small ones aren't worth it
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -94,8 +127,18 @@ async def root():
     }
 
 if __name__ == "__main__":
+    # Run from the project root (python -m api.main) so the project modules are importable
+    
     # Get port from environment variable or use default
     port = int(os.getenv("API_PORT", 8001))
     
-    # Run the API server
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True) 
\ No newline at end of file
+    # Run the API server with uvloop and httptools (uvloop is not available on Windows).
+    # Auto-reload is for local development only (DEV=1); use api.serve in production
+    uvicorn.run(
+        "api.main:app",
+        host="0.0.0.0",
+        port=port,
+        reload=os.getenv("DEV", "0") == "1",
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+    ) 
\ No newline at end of file
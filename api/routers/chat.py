@@ -1,36 +1,101 @@
 from fastapi import APIRouter, Body, Query, HTTPException, status, Path, Depends
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
-import uuid
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from typing import List, Dict, Any, Optional, Tuple, Callable, AsyncIterator
+from pydantic import BaseModel, Field
+import asyncio
+import datetime
+import logging
+import os
+import re
+import threading
+import time
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import lru_cache, partial
 
 # Import from main project
-from chat import ChatBot
+from chat import ChatBot, GREETING_RE, load_profiles_from_directory
+from db_client import SupabaseClient, TTLCache
+from semantic_cache import SemanticCache
+from api.deps import get_db_client
+from api.errors import catch_errors
+from utils import new_session_id
 
-# Create router
-router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Create router (orjson serializes the message/preference lists much faster than json)
+router = APIRouter(default_response_class=ORJSONResponse)
+
+# Cache of chat responses keyed by query embedding similarity
+response_cache = SemanticCache(
+    threshold=float(os.getenv("CHAT_CACHE_THRESHOLD", "0.95")),
+    ttl=int(os.getenv("CHAT_CACHE_TTL", "3600"))
+)
+
+# Cache of search_for_context results keyed by query embedding similarity. Crawled
+# content changes far less often than responses, so this skips the vector search
+# for repeated and near-duplicate questions
+context_cache = SemanticCache(
+    threshold=float(os.getenv("CHAT_CACHE_THRESHOLD", "0.95")),
+    ttl=int(os.getenv("CHAT_CONTEXT_CACHE_TTL", "300"))
+)
+
+# Conversation histories served by GET /history, keyed by session ID. Entries are
+# dropped when this process writes to the session, but other workers would keep
+# serving their stale copy, so histories are only cached with a single API worker
+_HISTORY_CACHE_TTL = float(os.getenv("CHAT_HISTORY_CACHE_TTL", "30"))
+_history_cache: Optional[TTLCache] = (
+    TTLCache(1024, _HISTORY_CACHE_TTL)
+    if _HISTORY_CACHE_TTL > 0 and int(os.getenv("API_WORKERS") or "1") <= 1 else None
+)
+
+def _forget_history(session_id: str):
+    """Drop a session's cached history after writing to it."""
+    if _history_cache is not None:
+        _history_cache.pop(session_id)
+
+# Comma-separated names of the crawled sites for the first-message prompt, with the
+# time it expires. Sites change when they're crawled, not between messages
+_sites_cache: Optional[Tuple[float, str]] = None
+_SITES_CACHE_TTL = float(os.getenv("CHAT_SITES_CACHE_TTL", "60"))
+
+# ChatBot and database calls block, and LLM calls can hold a thread for many
+# seconds, so they run on their own pool instead of the shared threadpool
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CHAT_THREADPOOL_SIZE", "32")),
+    thread_name_prefix="chat"
+)
+
+async def _run_blocking(func: Callable, *args, **kwargs):
+    """Run a blocking call on the chat executor without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+# Serialized profile lists keyed by active profile. The profiles registry is loaded
+# once per process, so entries never go stale
+_profiles_cache: Dict[str, bytes] = {}
 
 # Define models
 class Message(BaseModel):
     role: str
     content: str
     timestamp: Optional[str] = None
-    
-    class Config:
-        arbitrary_types_allowed = True
         
     @classmethod
     def from_dict(cls, message_dict):
         """Create a Message from a dictionary, converting datetime to string if needed."""
-        if 'timestamp' in message_dict and message_dict['timestamp'] is not None:
-            if not isinstance(message_dict['timestamp'], str):
-                message_dict['timestamp'] = str(message_dict['timestamp'])
-        return cls(**message_dict)
+        timestamp = message_dict.get('timestamp')
+        if timestamp is not None and timestamp.__class__ is not str:
+            message_dict['timestamp'] = str(timestamp)
+        # Rows come from our own database, so skip validation
+        return cls.model_construct(**message_dict)
 
 class ChatRequest(BaseModel):
-    message: str
-    session_id: Optional[str] = None
-    user_id: Optional[str] = None
-    profile: Optional[str] = None
+    message: str = Field(..., min_length=1, max_length=8192, pattern=r"\S")
+    session_id: Optional[str] = Field(None, min_length=1, max_length=64)
+    user_id: Optional[str] = Field(None, min_length=1, max_length=64)
+    profile: Optional[str] = Field(None, max_length=64)
 
 class ChatResponse(BaseModel):
     response: str
@@ -55,6 +120,9 @@ class ConversationHistoryResponse(BaseModel):
     session_id: str
     user_id: Optional[str] = None
 
+# Preference columns that come back from the database as datetimes
+_PREFERENCE_DATE_FIELDS = ('created_at', 'updated_at', 'last_used')
+
 class UserPreference(BaseModel):
     id: Optional[int] = None
     preference_type: str
@@ -67,24 +135,23 @@ class UserPreference(BaseModel):
     source_session: Optional[str] = None
     is_active: bool = True
     metadata: Optional[Dict[str, Any]] = None
-    
-    class Config:
-        arbitrary_types_allowed = True
         
     @classmethod
     def from_dict(cls, pref_dict):
         """Create a UserPreference from a dictionary, converting datetime to string if needed."""
-        for date_field in ['created_at', 'updated_at', 'last_used']:
-            if date_field in pref_dict and pref_dict[date_field] is not None:
-                if not isinstance(pref_dict[date_field], str):
-                    pref_dict[date_field] = str(pref_dict[date_field])
-        return cls(**pref_dict)
+        for date_field in _PREFERENCE_DATE_FIELDS:
+            value = pref_dict.get(date_field)
+            pref_dict[date_field] = value if value is None or value.__class__ is str else str(value)
+        # Rows come from our own database, so skip validation
+        return cls.model_construct(**pref_dict)
+
+_PREFERENCE_FIELDS = tuple(UserPreference.model_fields)
 
 class UserPreferenceCreate(BaseModel):
-    preference_type: str
-    preference_value: str
-    context: Optional[str] = None
-    confidence: float = 0.9
+    preference_type: str = Field(..., min_length=1, max_length=64, pattern=r"\S")
+    preference_value: str = Field(..., min_length=1, max_length=1024, pattern=r"\S")
+    context: Optional[str] = Field(None, max_length=8192)
+    confidence: float = Field(0.9, ge=0.0, le=1.0)
     metadata: Optional[Dict[str, Any]] = None
 
 class UserPreferenceResponse(BaseModel):
@@ -92,6 +159,49 @@ class UserPreferenceResponse(BaseModel):
     count: int
     user_id: str
 
+class PreferenceBulkRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+class PreferenceBulkResponse(BaseModel):
+    ids: List[int]
+    missing_ids: List[int]
+    user_id: str
+
+def _profiles_dir() -> str:
+    """Get the directory the profiles are loaded from, for the profile list and ChatBots alike."""
+    return os.getenv("CHAT_PROFILES_DIR", "profiles")
+
+# Each cached ChatBot keeps its session's conversation history in memory
+@lru_cache(maxsize=int(os.getenv("CHAT_BOT_CACHE_SIZE", "512")))
+def _get_cached_chat_bot(
+    model: Optional[str],
+    result_limit: Optional[int],
+    similarity_threshold: Optional[float],
+    session_id: Optional[str],
+    user_id: Optional[str],
+    profile: str,
+) -> ChatBot:
+    """Create a ChatBot once per configuration and reuse it across requests.
+
+    ChatBot setup loads profiles, builds the OpenAI client and prepares the
+    conversation history table, so it is too expensive to repeat on every
+    request. A request holds its session's lock while it uses one and calls
+    _load_session first, since the cached conversation may be out of date.
+    """
+    return ChatBot(
+        model=model,
+        result_limit=result_limit,
+        similarity_threshold=similarity_threshold,
+        session_id=session_id,
+        user_id=user_id,
+        profile=profile,
+        profiles_dir=_profiles_dir(),
+        verbose=False  # Always use quiet mode for API
+    )
+
+# Striped locks guarding ChatBot construction, bounded regardless of how many keys are cached
+_chat_bot_locks = [threading.Lock() for _ in range(64)]
+
 # Dependency to get a ChatBot instance
 def get_chat_bot(
     model: Optional[str] = None,
@@ -101,30 +211,328 @@ def get_chat_bot(
     user_id: Optional[str] = None,
     profile: str = "default",
 ):
+    key = (model, result_limit, similarity_threshold, session_id, user_id, profile)
     try:
-        return ChatBot(
-            model=model,
-            result_limit=result_limit,
-            similarity_threshold=similarity_threshold,
-            session_id=session_id,
-            user_id=user_id,
-            profile=profile,
-            verbose=False  # Always use quiet mode for API
-        )
+        # Concurrent first requests for the same key wait for one ChatBot instead of each building one
+        with _chat_bot_locks[hash(key) % len(_chat_bot_locks)]:
+            return _get_cached_chat_bot(*key)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error initializing ChatBot: {str(e)}"
         )
 
-@router.post("", response_model=ChatResponse)
+# ChatBot constructions in flight, so concurrent requests for the same key await one
+# future instead of each holding a thread while they wait for the construction lock
+_chat_bot_inflight: Dict[Tuple, asyncio.Future] = {}
+
+async def get_chat_bot_async(
+    model: Optional[str] = None,
+    result_limit: Optional[int] = None,
+    similarity_threshold: Optional[float] = None,
+    session_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    profile: str = "default",
+) -> ChatBot:
+    """Get a ChatBot from the event loop, sharing in-flight constructions."""
+    key = (model, result_limit, similarity_threshold, session_id, user_id, profile)
+    future = _chat_bot_inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_run_blocking(get_chat_bot, *key))
+        _chat_bot_inflight[key] = future
+        future.add_done_callback(lambda _: _chat_bot_inflight.pop(key, None))
+    
+    # A cancelled request must not cancel the construction for the others
+    return await asyncio.shield(future)
+
+# Locks by session ID, with the number of requests holding or waiting for each.
+# Cached ChatBots keep their conversation in memory, so a session's requests take
+# turns instead of changing it at the same time
+_session_locks: Dict[str, List] = {}
+
+async def _lock_session(session_id: str):
+    """Wait until no other request is using the session."""
+    entry = _session_locks.setdefault(session_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        await entry[0].acquire()
+    except BaseException:
+        _drop_session_lock(session_id, entry)
+        raise
+
+def _unlock_session(session_id: str):
+    """Let the next request use the session."""
+    entry = _session_locks[session_id]
+    entry[0].release()
+    _drop_session_lock(session_id, entry)
+
+def _drop_session_lock(session_id: str, entry: List):
+    entry[1] -= 1
+    if entry[1] == 0:
+        del _session_locks[session_id]
+
+@asynccontextmanager
+async def _session_lock(session_id: str):
+    """Hold the session's lock for the duration of a request."""
+    await _lock_session(session_id)
+    try:
+        yield
+    finally:
+        _unlock_session(session_id)
+
+def _load_session(chat_bot: ChatBot) -> bool:
+    """Bring a cached ChatBot up to date with its session before a request uses it.
+    
+    The session may have changed since the ChatBot last served it, through a
+    ChatBot for another profile or another worker, so the history is reloaded
+    and the profile's system prompt is added again if the session last used a
+    different profile.
+    
+    Returns:
+        Whether the next message is the first one in the session.
+    """
+    try:
+        chat_bot.load_conversation_history()
+    except Exception as history_error:
+        logger.warning("Error loading conversation history: %s", history_error)
+        return True
+    
+    last_profile = next(
+        (msg["metadata"].get("profile") for msg in reversed(chat_bot.conversation_history)
+         if isinstance(msg.get("metadata"), dict) and msg["metadata"].get("profile")),
+        None
+    )
+    if last_profile is not None and last_profile != chat_bot.profile_name:
+        chat_bot.set_profile(chat_bot.profile_name)
+    
+    return len(chat_bot.conversation_history) <= 1  # Only the system message or empty
+
+async def get_session_chat_bot(
+    session_id: str = Query(..., min_length=1, max_length=64, description="Session ID"),
+    user_id: Optional[str] = Query(None, min_length=1, max_length=64, description="User ID"),
+) -> AsyncIterator[ChatBot]:
+    """Dependency returning the ChatBot for a session, which the request has to itself."""
+    async with _session_lock(session_id):
+        yield await get_chat_bot_async(session_id=session_id, user_id=user_id)
+
+async def get_profile_chat_bot(
+    profile_name: str = Path(..., description="The name of the profile to set"),
+    session_id: str = Query(..., min_length=1, max_length=64, description="Session ID"),
+    user_id: Optional[str] = Query(None, min_length=1, max_length=64, description="User ID"),
+) -> AsyncIterator[ChatBot]:
+    """Dependency returning the ChatBot for a session with the given profile, switching the session to it."""
+    async with _session_lock(session_id):
+        chat_bot = await get_chat_bot_async(session_id=session_id, user_id=user_id, profile=profile_name)
+        await _run_blocking(_load_session, chat_bot)
+        yield chat_bot
+
+@lru_cache(maxsize=1)
+def get_profiles() -> Dict[str, Dict[str, Any]]:
+    """Load the chat profiles once and share them across requests."""
+    return load_profiles_from_directory(_profiles_dir())
+
+def _preference_dicts(preferences: List[Dict[str, Any]], active_only: bool) -> List[Dict[str, Any]]:
+    """Build UserPreference-shaped dicts from database rows without validation.
+    
+    Date columns are left as datetimes; ORJSONResponse writes them as ISO 8601.
+    """
+    fields = _PREFERENCE_FIELDS
+    return [
+        {
+            **dict(zip(fields, map(pref.get, fields))),
+            # Ensure is_active is a boolean, defaulting for rows without the column
+            "is_active": bool(pref["is_active"]) if "is_active" in pref else active_only
+        }
+        for pref in preferences
+    ]
+
+def _history_messages(conversation_history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Build Message-shaped dicts from a ChatBot conversation history without validation.
+    
+    ChatBot already stores timestamps as strings, so the dicts can be serialized as-is.
+    """
+    return [
+        {"role": msg["role"], "content": msg["content"], "timestamp": msg.get("timestamp")}
+        for msg in conversation_history
+    ]
+
+def _get_sites_str(chat_bot: ChatBot) -> str:
+    """Get the names of the crawled sites, reusing them for a short while."""
+    global _sites_cache
+    cached = _sites_cache
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    
+    sites = chat_bot.crawler.db_client.get_all_sites()
+    sites_str = ", ".join(site.get("name", "Unknown") for site in sites)
+    _sites_cache = (time.monotonic() + _SITES_CACHE_TTL, sites_str)
+    return sites_str
+
+def _prepare_conversation(chat_bot: ChatBot, is_first_message: bool):
+    """Add the first-message system prompt if needed."""
+    # Modify the system prompt for the first message to focus on crawled sites
+    if is_first_message:
+        # Get all available sites to mention in the greeting
+        try:
+            sites_str = _get_sites_str(chat_bot)
+            
+            if sites_str:
+                chat_bot.add_system_message(
+                    f"This is the first message in the conversation. You are a helpful assistant that specializes in providing information about the user's crawled sites: {sites_str}. "
+                    f"Your primary purpose is to help the user find and understand information from their crawled content. "
+                    f"In your greeting, focus on the user's crawled sites and how you can help them find information. "
+                    f"Do not mention unrelated topics like gardening, cooking, or ancient civilizations unless the user asks about them. "
+                    f"Suggest that the user can ask specific questions about their crawled sites."
+                )
+        except:
+            # If we can't get sites, still avoid random topics
+            chat_bot.add_system_message(
+                "This is the first message in the conversation. You are a helpful assistant that specializes in providing information about the user's crawled sites. "
+                "Your primary purpose is to help the user find and understand information from their crawled content. "
+                "In your greeting, focus on the user's crawled sites and how you can help them find information. "
+                "Do not mention unrelated topics unless the user asks about them."
+            )
+
+# Instructions added when search context is found for a message
+_CONTEXT_SYSTEM_MESSAGE = (
+    "IMPORTANT: You have access to information from the user's crawled sites. "
+    "When answering questions, prioritize information from these sources. "
+    "Integrate the information naturally into your responses rather than just listing sources. "
+    "If the user asks about a topic covered in their crawled sites, use that information to provide a detailed, "
+    "accurate response. Only mention that information comes from their crawled sites if it adds value to the response. "
+    "When referencing specific information, include relevant URLs as formatted links using markdown syntax: [link text](URL)."
+)
+
+# Extra instructions for questions about an app or specific product
+_APP_SYSTEM_MESSAGE = (
+    "The user is asking about a specific application or software tool. "
+    "If information about this app is found in the context, provide a comprehensive summary that includes: "
+    "1. What the app does and its main purpose "
+    "2. Key features and capabilities "
+    "3. Technical details if available "
+    "4. How to get or access the app "
+    "Make sure to use the information from the context rather than general knowledge."
+)
+
+# Whole words only, so e.g. "happy" or "approach" don't count as app questions
+_APP_TERM_RE = re.compile(r"\b(?:app|application|tool|software|program)s?\b", re.IGNORECASE)
+
+def _search_context(chat_bot: ChatBot, message: str,
+                    query_embedding: Optional[List[float]] = None) -> Optional[List[Dict[str, Any]]]:
+    """Search for context for a message.
+    
+    Only reads the conversation, so it can run alongside _prepare_conversation.
+    """
+    # Results depend on the profile's search settings as well as the query
+    namespace = (chat_bot.current_profile, chat_bot.search_limit, chat_bot.result_limit,
+                 chat_bot.similarity_threshold)
+    context = None
+    if query_embedding is not None:
+        context = context_cache.get(namespace, query_embedding)
+    
+    try:
+        if context is None:
+            context = chat_bot.search_for_context(message)
+            if context and query_embedding is not None:
+                context_cache.put(namespace, query_embedding, context)
+    except Exception as search_error:
+        logger.exception("Error in search_for_context: %s", search_error)
+        return None
+    
+    return context
+
+def _add_context_instructions(chat_bot: ChatBot, message: str):
+    """Add the system message with instructions on how to use the search context.
+    
+    Must run before get_response so the instructions are part of this turn's prompt.
+    """
+    instructions = [_CONTEXT_SYSTEM_MESSAGE]
+    
+    # Check if this is a query about an app or specific product
+    if _APP_TERM_RE.search(message):
+        # Add special instructions for app-related queries
+        instructions.append(_APP_SYSTEM_MESSAGE)
+    
+    # The whole history goes to the LLM, so skip instructions an earlier turn already added
+    system_text = "\n\n".join(
+        msg["content"] for msg in chat_bot.conversation_history if msg.get("role") == "system"
+    )
+    instructions = [instruction for instruction in instructions if instruction not in system_text]
+    if instructions:
+        chat_bot.add_system_message("\n\n".join(instructions))
+
+async def _prepare_turn(chat_bot: ChatBot, message: str, is_first_message: bool, is_greeting: bool,
+                        query_embedding: Optional[List[float]] = None) -> Optional[List[Dict[str, Any]]]:
+    """Add this turn's system messages before the LLM call and return the search context.
+    
+    The context search only reads the conversation, so it runs alongside the
+    first-message prompt; the instructions for using the context are added once
+    both are done. Greetings get no context.
+    """
+    if is_greeting:
+        await _run_blocking(_prepare_conversation, chat_bot, is_first_message)
+        return None
+    
+    _, context = await asyncio.gather(
+        _run_blocking(_prepare_conversation, chat_bot, is_first_message),
+        _run_blocking(_search_context, chat_bot, message, query_embedding)
+    )
+    if context:
+        await _run_blocking(_add_context_instructions, chat_bot, message)
+    return context
+
+def _get_response(
+    chat_bot: ChatBot,
+    message: str,
+    on_token: Optional[Callable[[str], None]] = None
+) -> Tuple[str, bool]:
+    """Get the LLM response and whether it was generated without errors.
+    
+    On an error, the apology to show instead is returned but not streamed.
+    """
+    try:
+        return chat_bot.get_response(message, on_token), True
+    except Exception as response_error:
+        logger.exception("Error in get_response: %s", response_error)
+        return _error_message(response_error), False
+
+def _error_message(error: BaseException) -> str:
+    """Build the reply shown when a response can't be generated."""
+    return f"I'm sorry, but I encountered an error processing your request. Error details: {str(error)}"
+
+def _record_cached_exchange(chat_bot: ChatBot, message: str, response: str):
+    """Save a cache-served exchange to the conversation history without generating a response."""
+    # Add the user message the usual way, so its preferences are still extracted and saved
+    chat_bot.add_user_message(message)
+    
+    chat_bot.conversation_history.append({
+        "role": "assistant",
+        "content": response,
+        "timestamp": datetime.datetime.now().isoformat()
+    })
+    try:
+        chat_bot.crawler.db_client.save_message(
+            session_id=chat_bot.session_id,
+            role="assistant",
+            content=response,
+            user_id=chat_bot.user_id,
+            metadata={"profile": chat_bot.profile_name, "cached": True}
+        )
+    except Exception as save_error:
+        logger.warning("Error saving cached assistant message: %s", save_error)
+
+# The handler builds the ChatResponse shape itself, so the model is only used for the docs
+@router.post("", responses={200: {"model": ChatResponse}})
+@catch_errors("Error in chat")
 async def chat(
     chat_request: ChatRequest = Body(...),
     model: Optional[str] = Query(None, description="The model to use for chat"),
-    result_limit: Optional[int] = Query(None, description="Maximum number of search results"),
-    similarity_threshold: Optional[float] = Query(None, description="Similarity threshold (0-1)"),
+    result_limit: Optional[int] = Query(None, ge=1, description="Maximum number of search results"),
+    similarity_threshold: Optional[float] = Query(None, ge=0.0, le=1.0, description="Similarity threshold (0-1)"),
     include_context: bool = Query(False, description="Include search context in the response"),
     include_history: bool = Query(False, description="Include conversation history in the response"),
+    no_cache: bool = Query(False, description="Bypass the semantic response cache"),
+    stream: bool = Query(False, description="Stream the response as Server-Sent Events"),
 ):
     """
     Send a message to the chat bot and get a response.
@@ -133,13 +541,18 @@ async def chat(
     - **session_id**: Session ID for persistent conversations
     - **user_id**: User ID for tracking conversations
     - **profile**: Profile to use
+    - **stream**: Stream the response like POST /stream
     """
-    try:
-        # Generate a session ID if not provided
-        session_id = chat_request.session_id or str(uuid.uuid4())
-        
+    if stream:
+        return await chat_stream(chat_request, model, result_limit, similarity_threshold)
+    
+    # Generate a session ID if not provided
+    session_id = chat_request.session_id or new_session_id()
+    
+    # The ChatBot is cached across requests, so the session's requests take turns
+    async with _session_lock(session_id):
         # Initialize ChatBot
-        chat_bot = get_chat_bot(
+        chat_bot = await get_chat_bot_async(
             model=model,
             result_limit=result_limit,
             similarity_threshold=similarity_threshold,
@@ -147,140 +560,165 @@ async def chat(
             user_id=chat_request.user_id,
             profile=chat_request.profile or "default"
         )
-        
+    
         # First message in a session should be about crawled sites, not random topics
-        is_first_message = False
-        try:
-            chat_bot.load_conversation_history()
-            is_first_message = len(chat_bot.conversation_history) <= 1  # Only the system message or empty
-        except Exception as history_error:
-            print(f"Error loading conversation history: {history_error}")
-            is_first_message = True
-            
-        # Get search context first
-        try:
-            context = chat_bot.search_for_context(chat_request.message)
-        except Exception as search_error:
-            print(f"Error in search_for_context: {search_error}")
-            import traceback
-            traceback.print_exc()
-            context = None
-        
-        # Check if this is a simple greeting
-        greeting_patterns = [
-            "hi", "hello", "hey", "greetings", "howdy", "hola", 
-            "how are you", "how's it going", "what's up", "sup", 
-            "good morning", "good afternoon", "good evening"
-        ]
-        
-        is_greeting = False
-        clean_message = chat_request.message.strip().lower()
-        for greeting in greeting_patterns:
-            if greeting in clean_message:
-                is_greeting = True
-                break
-        
-        # For greetings, don't add context or special instructions
-        if is_greeting:
-            # Skip context for greetings to avoid irrelevant information
-            context = None
+        is_first_message = await _run_blocking(_load_session, chat_bot)
+    
+        # Greetings get a short reply without search context, so they skip the
+        # embedding for the response cache as well as the context search
+        is_greeting = GREETING_RE.search(chat_request.message) is not None
         
-        # Modify the system prompt for the first message to focus on crawled sites
-        if is_first_message:
-            # Get all available sites to mention in the greeting
+        # Reuse the answer to a semantically similar opening question. A follow-up's answer
+        # depends on the conversation so far, which no other request repeats, so follow-ups
+        # skip the cache and its embedding. An opening answer only depends on the profile,
+        # the model and the user (their name and preferences are in the prompt), so
+        # anonymous conversations share them
+        has_exchanges = any(msg.get("role") in ("user", "assistant") for msg in chat_bot.conversation_history)
+        cache_namespace = (chat_bot.current_profile, chat_bot.model, chat_bot.user_id)
+        query_embedding = None
+        cached_response = None
+        if not no_cache and not is_greeting and not has_exchanges:
             try:
-                sites = chat_bot.crawler.db_client.get_all_sites()
-                site_names = [site.get("name", "Unknown") for site in sites]
-                
-                if site_names:
-                    sites_str = ", ".join(site_names)
-                    chat_bot.add_system_message(
-                        f"This is the first message in the conversation. You are a helpful assistant that specializes in providing information about the user's crawled sites: {sites_str}. "
-                        f"Your primary purpose is to help the user find and understand information from their crawled content. "
-                        f"In your greeting, focus on the user's crawled sites and how you can help them find information. "
-                        f"Do not mention unrelated topics like gardening, cooking, or ancient civilizations unless the user asks about them. "
-                        f"Suggest that the user can ask specific questions about their crawled sites."
-                    )
-            except:
-                # If we can't get sites, still avoid random topics
-                chat_bot.add_system_message(
-                    "This is the first message in the conversation. You are a helpful assistant that specializes in providing information about the user's crawled sites. "
-                    "Your primary purpose is to help the user find and understand information from their crawled content. "
-                    "In your greeting, focus on the user's crawled sites and how you can help them find information. "
-                    "Do not mention unrelated topics unless the user asks about them."
+                query_embedding = await _run_blocking(
+                    chat_bot.crawler.embedding_generator.generate_embedding, chat_request.message
                 )
-        
-        # Add a system message with instructions on how to use the context
-        if context and not is_greeting:
-            chat_bot.add_system_message(
-                "IMPORTANT: You have access to information from the user's crawled sites. "
-                "When answering questions, prioritize information from these sources. "
-                "Integrate the information naturally into your responses rather than just listing sources. "
-                "If the user asks about a topic covered in their crawled sites, use that information to provide a detailed, "
-                "accurate response. Only mention that information comes from their crawled sites if it adds value to the response. "
-                "When referencing specific information, include relevant URLs as formatted links using markdown syntax: [link text](URL)."
+                cached_response = response_cache.get(cache_namespace, query_embedding)
+            except Exception as cache_error:
+                logger.warning("Error checking response cache: %s", cache_error)
+    
+        if cached_response is not None:
+            response, context = cached_response
+            await _run_blocking(_record_cached_exchange, chat_bot, chat_request.message, response)
+        else:
+            context = await _prepare_turn(
+                chat_bot, chat_request.message, is_first_message, is_greeting, query_embedding
             )
-            
-            # Check if this is a query about an app or specific product
-            if any(term in chat_request.message.lower() for term in ['app', 'application', 'tool', 'software', 'program']):
-                # Add special instructions for app-related queries
-                chat_bot.add_system_message(
-                    "The user is asking about a specific application or software tool. "
-                    "If information about this app is found in the context, provide a comprehensive summary that includes: "
-                    "1. What the app does and its main purpose "
-                    "2. Key features and capabilities "
-                    "3. Technical details if available "
-                    "4. How to get or access the app "
-                    "Make sure to use the information from the context rather than general knowledge."
-                )
-        
-        # Get response
-        try:
-            response = chat_bot.get_response(chat_request.message)
-        except Exception as response_error:
-            print(f"Error in get_response: {response_error}")
-            import traceback
-            traceback.print_exc()
-            response = f"I'm sorry, but I encountered an error processing your request. Error details: {str(response_error)}"
+            response, succeeded = await _run_blocking(_get_response, chat_bot, chat_request.message)
         
+            if succeeded and query_embedding is not None:
+                response_cache.put(cache_namespace, query_embedding, (response, context))
+    
+        # The session has new messages
+        _forget_history(session_id)
+    
         # Prepare the response
         chat_response = {
             "response": response,
             "session_id": session_id,
             "user_id": chat_request.user_id
         }
-        
-        # Include context in the response only if it's not a greeting
-        if context and not is_greeting:
+    
+        # Include context in the response if requested (greetings never carry context)
+        if include_context and context:
             chat_response["context"] = context
-        
-        # Include conversation history if requested
+    
+        # Include conversation history if requested. It was loaded before the
+        # response and every message since was appended in memory as it was saved,
+        # so there's no need to read it back from the database
         if include_history:
-            # Load conversation history
-            chat_bot.load_conversation_history()
-            
-            # Convert to Message model
-            messages = []
-            for msg in chat_bot.conversation_history:
-                messages.append(Message(
-                    role=msg["role"],
-                    content=msg["content"],
-                    timestamp=msg.get("timestamp")
-                ))
-            
-            chat_response["conversation_history"] = messages
+            chat_response["conversation_history"] = _history_messages(chat_bot.conversation_history)
+    
+        return ORJSONResponse(chat_response)
+
+@router.post("/stream")
+@catch_errors("Error in chat")
+async def chat_stream(
+    chat_request: ChatRequest = Body(...),
+    model: Optional[str] = Query(None, description="The model to use for chat"),
+    result_limit: Optional[int] = Query(None, ge=1, description="Maximum number of search results"),
+    similarity_threshold: Optional[float] = Query(None, ge=0.0, le=1.0, description="Similarity threshold (0-1)"),
+):
+    """
+    Send a message to the chat bot and stream the response as Server-Sent Events.
+    
+    Each event carries a `delta` with the next piece of the response; the last
+    event has `done: true` along with the session and user IDs.
+    """
+    # Generate a session ID if not provided
+    session_id = chat_request.session_id or new_session_id()
+    
+    # Initialize ChatBot
+    chat_bot = await get_chat_bot_async(
+        model=model,
+        result_limit=result_limit,
+        similarity_threshold=similarity_threshold,
+        session_id=session_id,
+        user_id=chat_request.user_id,
+        profile=chat_request.profile or "default"
+    )
+    
+    # Tokens are produced in the threadpool and handed to the event loop through a queue
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    def on_token(token: str):
+        loop.call_soon_threadsafe(queue.put_nowait, token)
+    
+    # Greetings get a short reply without search context
+    is_greeting = GREETING_RE.search(chat_request.message) is not None
+    
+    def generate():
+        # First message in a session should be about crawled sites, not random topics
+        is_first_message = _load_session(chat_bot)
+        _prepare_conversation(chat_bot, is_first_message)
+        if not is_greeting and _search_context(chat_bot, chat_request.message):
+            _add_context_instructions(chat_bot, chat_request.message)
+        result = _get_response(chat_bot, chat_request.message, on_token)
+        _forget_history(session_id)
+        return result
+    
+    async def events():
+        # The ChatBot is cached across requests, so the session's requests take turns.
+        # The lock is held until the response is generated, even if the client leaves
+        await _lock_session(session_id)
+        task = None
+        try:
+            task = asyncio.ensure_future(_run_blocking(generate))
+            task.add_done_callback(lambda _: queue.put_nowait(None))
+            task.add_done_callback(lambda _: _unlock_session(session_id))
+        finally:
+            if task is None:
+                _unlock_session(session_id)
         
-        return chat_response
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error in chat: {str(e)}"
-        )
+        while True:
+            token = await queue.get()
+            if token is None:
+                break
+            yield b"data: " + orjson.dumps({"delta": token}) + b"\n\n"
+        
+        # Part of the response may already be sent, so errors get their own event
+        # instead of being appended to it
+        if task.cancelled():
+            error = "The response was cancelled"
+        elif task.exception() is not None:
+            logger.error("Error in chat stream", exc_info=task.exception())
+            error = _error_message(task.exception())
+        else:
+            response, succeeded = task.result()
+            error = None if succeeded else response
+        if error is not None:
+            yield b"event: error\ndata: " + orjson.dumps({"error": error}) + b"\n\n"
+        
+        yield b"data: " + orjson.dumps({
+            "done": True,
+            "session_id": session_id,
+            "user_id": chat_request.user_id
+        }) + b"\n\n"
+    
+    # GZipMiddleware leaves responses that already set Content-Encoding alone,
+    # which keeps it from buffering the events
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Content-Encoding": "identity"}
+    )
 
-@router.get("/profiles", response_model=ProfileListResponse)
+@router.get("/profiles", responses={200: {"model": ProfileListResponse}})
+@catch_errors("Error listing profiles")
 async def list_profiles(
-    session_id: Optional[str] = Query(None, description="Session ID to get active profile"),
-    user_id: Optional[str] = Query(None, description="User ID")
+    session_id: Optional[str] = Query(None, min_length=1, max_length=64, description="Session ID to get active profile"),
+    user_id: Optional[str] = Query(None, min_length=1, max_length=64, description="User ID"),
+    profiles: Dict[str, Dict[str, Any]] = Depends(get_profiles),
 ):
     """
     List all available profiles.
@@ -288,42 +726,40 @@ async def list_profiles(
     - **session_id**: Optional session ID to get active profile
     - **user_id**: Optional user ID
     """
-    try:
-        # Initialize ChatBot
-        chat_bot = get_chat_bot(
-            session_id=session_id,
-            user_id=user_id
-        )
-        
-        # Get profiles
-        profiles = chat_bot.profiles
-        active_profile = chat_bot.current_profile
-        
-        # Convert to ProfileResponse model
-        profile_list = []
-        for name, profile in profiles.items():
-            profile_list.append(ProfileResponse(
-                name=name,
-                description=profile.get("description", ""),
-                is_active=(name == active_profile)
-            ))
-        
-        return ProfileListResponse(
-            profiles=profile_list,
-            count=len(profile_list),
-            active_profile=active_profile
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error listing profiles: {str(e)}"
-        )
+    # Sessions are created with the default profile; set_profile doesn't persist a choice
+    active_profile = "default"
+    
+    # Reuse the serialized list if it was already rendered
+    content = _profiles_cache.get(active_profile)
+    if content is not None:
+        return Response(content=content, media_type="application/json")
+    
+    # Build the ProfileResponse shape as plain dicts
+    profile_list = [
+        {
+            "name": name,
+            "description": profile.get("description", ""),
+            "is_active": name == active_profile
+        }
+        for name, profile in profiles.items()
+    ]
+    
+    content = orjson.dumps({
+        "profiles": profile_list,
+        "count": len(profile_list),
+        "active_profile": active_profile
+    })
+    _profiles_cache[active_profile] = content
+    
+    return Response(content=content, media_type="application/json")
 
-@router.post("/profiles/{profile_name}", response_model=Dict[str, Any])
+@router.post("/profiles/{profile_name}")
+@catch_errors("Error setting profile")
 async def set_profile(
     profile_name: str = Path(..., description="The name of the profile to set"),
-    session_id: str = Query(..., description="Session ID"),
-    user_id: Optional[str] = Query(None, description="User ID")
+    session_id: str = Query(..., min_length=1, max_length=64, description="Session ID"),
+    user_id: Optional[str] = Query(None, min_length=1, max_length=64, description="User ID"),
+    chat_bot: ChatBot = Depends(get_profile_chat_bot),
 ):
     """
     Set the active profile for a session.
@@ -332,66 +768,57 @@ async def set_profile(
     - **session_id**: Session ID
     - **user_id**: Optional user ID
     """
-    try:
-        # Initialize ChatBot with the specified profile
-        chat_bot = get_chat_bot(
-            session_id=session_id,
-            user_id=user_id,
-            profile=profile_name
-        )
-        
-        # Return success response
-        return {
-            "success": True,
-            "message": f"Profile set to {profile_name}",
-            "profile": profile_name,
-            "session_id": session_id
-        }
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error setting profile: {str(e)}"
-        )
+    # Return success response
+    return {
+        "success": True,
+        "message": f"Profile set to {profile_name}",
+        "profile": profile_name,
+        "session_id": session_id
+    }
 
-@router.get("/history", response_model=ConversationHistoryResponse)
+@router.get("/history", responses={200: {"model": ConversationHistoryResponse}})
+@catch_errors("Error getting conversation history")
 async def get_conversation_history(
-    session_id: str = Query(..., description="Session ID"),
-    user_id: Optional[str] = Query(None, description="User ID"),
+    session_id: str = Query(..., min_length=1, max_length=64, description="Session ID"),
+    user_id: Optional[str] = Query(None, min_length=1, max_length=64, description="User ID"),
+    stream: bool = Query(False, description="Stream the messages as newline-delimited JSON"),
+    chat_bot: ChatBot = Depends(get_session_chat_bot),
 ):
     """
     Get conversation history for a session.
     
     - **session_id**: The session ID
     - **user_id**: Optional user ID
+    - **stream**: Return one JSON message per line instead of a single object
     """
-    try:
-        # Initialize ChatBot
-        chat_bot = get_chat_bot(session_id=session_id, user_id=user_id)
-        
+    messages = _history_cache.get(session_id) if _history_cache is not None else None
+    if messages is None:
         # Load conversation history
-        chat_bot.load_conversation_history()
-        
-        # Convert to Message objects
-        messages = []
-        for msg in chat_bot.conversation_history:
-            messages.append(Message.from_dict(msg))
+        await _run_blocking(chat_bot.load_conversation_history)
         
-        return ConversationHistoryResponse(
-            messages=messages,
-            count=len(messages),
-            session_id=session_id,
-            user_id=user_id
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error getting conversation history: {str(e)}"
+        messages = _history_messages(chat_bot.conversation_history)
+        if _history_cache is not None:
+            _history_cache.set(session_id, messages)
+    
+    if stream:
+        return StreamingResponse(
+            (orjson.dumps(message) + b"\n" for message in messages),
+            media_type="application/x-ndjson"
         )
+    
+    return ORJSONResponse({
+        "messages": messages,
+        "count": len(messages),
+        "session_id": session_id,
+        "user_id": user_id
+    })
 
-@router.delete("/history", response_model=Dict[str, Any])
+@router.delete("/history", status_code=status.HTTP_204_NO_CONTENT, response_class=Response)
+@catch_errors("Error clearing conversation history")
 async def clear_conversation_history(
-    session_id: str = Query(..., description="Session ID"),
-    user_id: Optional[str] = Query(None, description="User ID"),
+    session_id: str = Query(..., min_length=1, max_length=64, description="Session ID"),
+    user_id: Optional[str] = Query(None, min_length=1, max_length=64, description="User ID"),
+    chat_bot: ChatBot = Depends(get_session_chat_bot),
 ):
     """
     Clear conversation history for a session.
@@ -399,31 +826,45 @@ async def clear_conversation_history(
     - **session_id**: The session ID
     - **user_id**: Optional user ID
     """
-    try:
-        # Initialize ChatBot
-        chat_bot = get_chat_bot(session_id=session_id, user_id=user_id)
-        
-        # Clear conversation history
-        chat_bot.clear_conversation_history()
-        
-        return {
-            "message": "Conversation history cleared",
-            "session_id": session_id,
-            "user_id": user_id
-        }
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error clearing conversation history: {str(e)}"
-        )
+    # Clear conversation history
+    await _run_blocking(chat_bot.clear_conversation_history)
+    _forget_history(session_id)
+    
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 # User Preferences Endpoints
 
-@router.get("/preferences", response_model=UserPreferenceResponse)
+async def _raise_preference_error(db_client: SupabaseClient, preference_id: int, user_id: str, action: str):
+    """Raise the HTTP error for a preference change that matched no rows.
+    
+    The change itself checks ownership, so the preference is only looked up on failure.
+    """
+    preference = await _run_blocking(db_client.get_preference_by_id, preference_id)
+    
+    if not preference:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Preference with ID {preference_id} not found"
+        )
+    
+    if preference.get("user_id") != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"You do not have permission to {action} this preference"
+        )
+    
+    raise HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"Failed to {action} preference"
+    )
+
+@router.get("/preferences", responses={200: {"model": UserPreferenceResponse}})
+@catch_errors("Error getting user preferences")
 async def get_user_preferences(
-    user_id: str = Query(..., description="User ID"),
-    min_confidence: float = Query(0.0, description="Minimum confidence score (0-1)"),
+    user_id: str = Query(..., min_length=1, max_length=64, description="User ID"),
+    min_confidence: float = Query(0.0, ge=0.0, le=1.0, description="Minimum confidence score (0-1)"),
     active_only: bool = Query(True, description="Whether to return only active preferences"),
+    db_client: SupabaseClient = Depends(get_db_client),
 ):
     """
     Get preferences for a user.
@@ -432,43 +873,28 @@ async def get_user_preferences(
     - **min_confidence**: Minimum confidence score (0-1) for preferences to return
     - **active_only**: Whether to return only active preferences
     """
-    try:
-        # Initialize ChatBot
-        chat_bot = get_chat_bot(user_id=user_id)
-        
-        # Get preferences
-        preferences = chat_bot.crawler.db_client.get_user_preferences(
-            user_id, min_confidence, active_only
-        )
-        
-        # Convert to Pydantic models
-        preference_models = []
-        for pref in preferences:
-            # Ensure is_active is a boolean
-            if 'is_active' in pref:
-                pref['is_active'] = bool(pref['is_active'])
-            else:
-                # Default to True if not present (for backward compatibility)
-                pref['is_active'] = True if active_only else False
-                
-            preference_models.append(UserPreference.from_dict(pref))
-        
-        return UserPreferenceResponse(
-            preferences=preference_models,
-            count=len(preference_models),
-            user_id=user_id
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error getting user preferences: {str(e)}"
-        )
+    # Get preferences
+    preferences = await _run_blocking(
+        db_client.get_user_preferences,
+        user_id, min_confidence, active_only
+    )
+    
+    # Build the UserPreferenceResponse shape as plain dicts
+    preference_dicts = _preference_dicts(preferences, active_only)
+    
+    return ORJSONResponse({
+        "preferences": preference_dicts,
+        "count": len(preference_dicts),
+        "user_id": user_id
+    })
 
-@router.post("/preferences", response_model=UserPreference)
+@router.post("/preferences", responses={200: {"model": UserPreference}})
+@catch_errors("Error creating user preference")
 async def create_user_preference(
-    user_id: str = Query(..., description="User ID"),
-    session_id: Optional[str] = Query(None, description="Session ID"),
+    user_id: str = Query(..., min_length=1, max_length=64, description="User ID"),
+    session_id: Optional[str] = Query(None, min_length=1, max_length=64, description="Session ID"),
     preference: UserPreferenceCreate = Body(...),
+    db_client: SupabaseClient = Depends(get_db_client),
 ):
     """
     Create a new user preference.
@@ -477,35 +903,29 @@ async def create_user_preference(
     - **session_id**: Optional session ID
     - **preference**: The preference to create
     """
-    try:
-        # Initialize ChatBot
-        chat_bot = get_chat_bot(user_id=user_id, session_id=session_id)
-        
-        # Save the preference to the database
-        preference_id = chat_bot.crawler.db_client.save_user_preference(
-            user_id=user_id,
-            preference_type=preference.preference_type,
-            preference_value=preference.preference_value,
-            context=preference.context,
-            confidence=preference.confidence,
-            source_session=session_id,
-            metadata=preference.metadata
-        )
-        
-        # Get the created preference
-        created_preference = chat_bot.crawler.db_client.get_preference_by_id(preference_id)
-        
-        return UserPreference.from_dict(created_preference)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error creating user preference: {str(e)}"
-        )
+    # Save the preference to the database
+    preference_id = await _run_blocking(
+        db_client.save_user_preference,
+        user_id=user_id,
+        preference_type=preference.preference_type,
+        preference_value=preference.preference_value,
+        context=preference.context,
+        confidence=preference.confidence,
+        source_session=session_id,
+        metadata=preference.metadata
+    )
+    
+    # Get the created preference
+    created_preference = await _run_blocking(db_client.get_preference_by_id, preference_id)
+    
+    return ORJSONResponse(_preference_dicts([created_preference], True)[0])
 
-@router.delete("/preferences/{preference_id}", response_model=Dict[str, Any])
+@router.delete("/preferences/{preference_id}", status_code=status.HTTP_204_NO_CONTENT, response_class=Response)
+@catch_errors("Error deleting user preference")
 async def delete_user_preference(
     preference_id: int = Path(..., description="The ID of the preference to delete"),
-    user_id: str = Query(..., description="User ID"),
+    user_id: str = Query(..., min_length=1, max_length=64, description="User ID"),
+    db_client: SupabaseClient = Depends(get_db_client),
 ):
     """
     Delete a user preference.
@@ -513,51 +933,20 @@ async def delete_user_preference(
     - **preference_id**: The ID of the preference to delete
     - **user_id**: The user ID
     """
-    try:
-        # Initialize ChatBot
-        chat_bot = get_chat_bot(user_id=user_id)
-        
-        # Get the preference to verify ownership
-        preference = chat_bot.crawler.db_client.get_preference_by_id(preference_id)
-        
-        if not preference:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Preference with ID {preference_id} not found"
-            )
-        
-        if preference.get("user_id") != user_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You do not have permission to delete this preference"
-            )
-        
-        # Delete the preference
-        success = chat_bot.crawler.db_client.delete_user_preference(preference_id)
-        
-        if not success:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to delete preference"
-            )
-        
-        return {
-            "message": f"Preference with ID {preference_id} deleted",
-            "id": preference_id,
-            "user_id": user_id
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error deleting user preference: {str(e)}"
-        )
+    # Delete the preference if it belongs to the user
+    success = await _run_blocking(db_client.delete_user_preference, preference_id, user_id)
+    
+    if not success:
+        await _raise_preference_error(db_client, preference_id, user_id, "delete")
+    
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
-@router.put("/preferences/{preference_id}/deactivate", response_model=Dict[str, Any])
+@router.put("/preferences/{preference_id}/deactivate")
+@catch_errors("Error deactivating user preference")
 async def deactivate_user_preference(
     preference_id: int = Path(..., description="The ID of the preference to deactivate"),
-    user_id: str = Query(..., description="User ID"),
+    user_id: str = Query(..., min_length=1, max_length=64, description="User ID"),
+    db_client: SupabaseClient = Depends(get_db_client),
 ):
     """
     Deactivate a user preference.
@@ -565,51 +954,24 @@ async def deactivate_user_preference(
     - **preference_id**: The ID of the preference to deactivate
     - **user_id**: The user ID
     """
-    try:
-        # Initialize ChatBot
-        chat_bot = get_chat_bot(user_id=user_id)
-        
-        # Get the preference to verify ownership
-        preference = chat_bot.crawler.db_client.get_preference_by_id(preference_id)
-        
-        if not preference:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Preference with ID {preference_id} not found"
-            )
-        
-        if preference.get("user_id") != user_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You do not have permission to deactivate this preference"
-            )
-        
-        # Deactivate the preference
-        success = chat_bot.crawler.db_client.deactivate_user_preference(preference_id)
-        
-        if not success:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to deactivate preference"
-            )
-        
-        return {
-            "message": f"Preference with ID {preference_id} deactivated",
-            "id": preference_id,
-            "user_id": user_id
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error deactivating user preference: {str(e)}"
-        )
+    # Deactivate the preference if it belongs to the user
+    success = await _run_blocking(db_client.deactivate_user_preference, preference_id, user_id)
+    
+    if not success:
+        await _raise_preference_error(db_client, preference_id, user_id, "deactivate")
+    
+    return {
+        "message": f"Preference with ID {preference_id} deactivated",
+        "id": preference_id,
+        "user_id": user_id
+    }
 
-@router.put("/preferences/{preference_id}/activate", response_model=Dict[str, Any])
+@router.put("/preferences/{preference_id}/activate")
+@catch_errors("Error activating user preference")
 async def activate_user_preference(
     preference_id: int = Path(..., description="The ID of the preference to activate"),
-    user_id: str = Query(..., description="User ID"),
+    user_id: str = Query(..., min_length=1, max_length=64, description="User ID"),
+    db_client: SupabaseClient = Depends(get_db_client),
 ):
     """
     Activate a user preference.
@@ -617,75 +979,106 @@ async def activate_user_preference(
     - **preference_id**: The ID of the preference to activate
     - **user_id**: The user ID
     """
-    try:
-        # Initialize ChatBot
-        chat_bot = get_chat_bot(user_id=user_id)
-        
-        # Get the preference to verify ownership
-        preference = chat_bot.crawler.db_client.get_preference_by_id(preference_id)
-        
-        if not preference:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Preference with ID {preference_id} not found"
-            )
-        
-        if preference.get("user_id") != user_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You do not have permission to activate this preference"
-            )
-        
-        # Activate the preference
-        success = chat_bot.crawler.db_client.activate_user_preference(preference_id)
-        
-        if not success:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to activate preference"
-            )
-        
-        return {
-            "message": f"Preference with ID {preference_id} activated",
-            "id": preference_id,
-            "user_id": user_id
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
+    # Activate the preference if it belongs to the user
+    success = await _run_blocking(db_client.activate_user_preference, preference_id, user_id)
+    
+    if not success:
+        await _raise_preference_error(db_client, preference_id, user_id, "activate")
+    
+    return {
+        "message": f"Preference with ID {preference_id} activated",
+        "id": preference_id,
+        "user_id": user_id
+    }
+
+def _bulk_result(requested_ids: List[int], changed_ids: Optional[List[int]], user_id: str, action: str) -> Dict[str, Any]:
+    """Build the response for a bulk preference update."""
+    if changed_ids is None:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error activating user preference: {str(e)}"
+            detail=f"Failed to {action} preferences"
         )
+    
+    # IDs that weren't changed don't exist or belong to another user
+    changed = set(changed_ids)
+    return {
+        "ids": changed_ids,
+        "missing_ids": [preference_id for preference_id in dict.fromkeys(requested_ids) if preference_id not in changed],
+        "user_id": user_id
+    }
 
-@router.delete("/preferences", response_model=Dict[str, Any])
+@router.post("/preferences/bulk/deactivate", responses={200: {"model": PreferenceBulkResponse}})
+@catch_errors("Error deactivating user preferences")
+async def bulk_deactivate_user_preferences(
+    request: PreferenceBulkRequest = Body(...),
+    user_id: str = Query(..., min_length=1, max_length=64, description="User ID"),
+    db_client: SupabaseClient = Depends(get_db_client),
+):
+    """
+    Deactivate several of a user's preferences at once.
+    
+    - **ids**: The IDs of the preferences to deactivate
+    - **user_id**: The user ID
+    """
+    # Deactivate the preferences that belong to the user
+    changed_ids = await _run_blocking(db_client.set_user_preferences_active, request.ids, False, user_id)
+    
+    return _bulk_result(request.ids, changed_ids, user_id, "deactivate")
+
+@router.post("/preferences/bulk/activate", responses={200: {"model": PreferenceBulkResponse}})
+@catch_errors("Error activating user preferences")
+async def bulk_activate_user_preferences(
+    request: PreferenceBulkRequest = Body(...),
+    user_id: str = Query(..., min_length=1, max_length=64, description="User ID"),
+    db_client: SupabaseClient = Depends(get_db_client),
+):
+    """
+    Activate several of a user's preferences at once.
+    
+    - **ids**: The IDs of the preferences to activate
+    - **user_id**: The user ID
+    """
+    # Activate the preferences that belong to the user
+    changed_ids = await _run_blocking(db_client.set_user_preferences_active, request.ids, True, user_id)
+    
+    return _bulk_result(request.ids, changed_ids, user_id, "activate")
+
+@router.post("/preferences/bulk/delete", responses={200: {"model": PreferenceBulkResponse}})
+@catch_errors("Error deleting user preferences")
+async def bulk_delete_user_preferences(
+    request: PreferenceBulkRequest = Body(...),
+    user_id: str = Query(..., min_length=1, max_length=64, description="User ID"),
+    db_client: SupabaseClient = Depends(get_db_client),
+):
+    """
+    Delete several of a user's preferences at once.
+    
+    - **ids**: The IDs of the preferences to delete
+    - **user_id**: The user ID
+    """
+    # Delete the preferences that belong to the user
+    changed_ids = await _run_blocking(db_client.delete_user_preferences, request.ids, user_id)
+    
+    return _bulk_result(request.ids, changed_ids, user_id, "delete")
+
+@router.delete("/preferences", status_code=status.HTTP_204_NO_CONTENT, response_class=Response)
+@catch_errors("Error clearing user preferences")
 async def clear_user_preferences(
-    user_id: str = Query(..., description="User ID"),
+    user_id: str = Query(..., min_length=1, max_length=64, description="User ID"),
+    db_client: SupabaseClient = Depends(get_db_client),
 ):
     """
     Clear all preferences for a user.
     
     - **user_id**: The user ID
     """
-    try:
-        # Initialize ChatBot
-        chat_bot = get_chat_bot(user_id=user_id)
-        
-        # Clear preferences
-        success = chat_bot.crawler.db_client.clear_user_preferences(user_id)
-        
-        if not success:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to clear preferences"
-            )
-        
-        return {
-            "message": f"All preferences cleared for user {user_id}",
-            "user_id": user_id
-        }
-    except Exception as e:
+    # Clear preferences
+    success = await _run_blocking(db_client.clear_user_preferences, user_id)
+    
+    if not success:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error clearing user preferences: {str(e)}"
-        ) 
\ No newline at end of file
+            detail="Failed to clear preferences"
+        )
+    
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
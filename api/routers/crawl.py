@@ -1,16 +1,68 @@
-from fastapi import APIRouter, Body, Query, HTTPException, status, BackgroundTasks
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel, AnyHttpUrl, field_validator
+from fastapi import APIRouter, Body, Query, HTTPException, status, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from typing import List, Dict, Optional, Literal
+from pydantic import BaseModel, ConfigDict, Field
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import asyncio
+import logging
+import os
+import threading
 
 # Import from main project
 from crawler import WebCrawler
+from api.deps import get_crawler
+from api.errors import catch_errors
+
+logger = logging.getLogger(__name__)
 
 # Create router
 router = APIRouter()
 
+# Crawls run for minutes and block throughout, so they get their own small pool
+# instead of holding threads of the shared threadpool, and only a bounded number
+# may be running or waiting at once
+_crawl_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CRAWL_CONCURRENCY", "2")),
+    thread_name_prefix="crawl"
+)
+_crawl_slots = threading.BoundedSemaphore(int(os.getenv("CRAWL_QUEUE_SIZE", "16")))
+
+# Site IDs of the crawls that are queued or running, by their future
+_crawl_futures: Dict[Future, int] = {}
+_crawl_futures_lock = threading.Lock()
+
+def _crawl_done(future: Future):
+    """Free the slot of a finished or cancelled crawl."""
+    with _crawl_futures_lock:
+        _crawl_futures.pop(future, None)
+    _crawl_slots.release()
+
+def shutdown_crawls(timeout: float = float(os.getenv("CRAWL_SHUTDOWN_TIMEOUT", "10"))):
+    """Drop the queued crawls and give the running ones a bounded time to finish.
+    
+    Crawls still running after `timeout` seconds are logged and abandoned, so a
+    long crawl doesn't hold up the worker's shutdown.
+    """
+    _crawl_executor.shutdown(wait=False, cancel_futures=True)
+    
+    with _crawl_futures_lock:
+        running = dict(_crawl_futures)
+    _, not_done = wait(running, timeout=timeout)
+    for future in not_done:
+        logger.warning("Abandoning crawl for site %s, still running at shutdown", running[future])
+
+# Stored as the site description until the AI has generated one
+_AI_PLACEHOLDER = "AI is generating a description... (refresh in a moment)"
+
 # Define models
 class CrawlRequest(BaseModel):
-    url: str
+    # The request is only read after validation
+    model_config = ConfigDict(frozen=True)
+    
+    # Simple URL validation, checked by pydantic-core without a Python validator
+    url: str = Field(..., pattern=r"^https?://", description="URL to crawl, starting with http:// or https://")
     site_name: Optional[str] = None
     site_description: Optional[str] = None
     is_sitemap: bool = False
@@ -21,7 +73,7 @@ class CrawlRequest(BaseModel):
     
     # Browser options
     headless: Optional[bool] = None
-    browser_type: Optional[str] = None
+    browser_type: Optional[Literal['chromium', 'firefox', 'webkit']] = None
     proxy: Optional[str] = None
     javascript_enabled: Optional[bool] = None
     user_agent: Optional[str] = None
@@ -41,27 +93,8 @@ class CrawlRequest(BaseModel):
     max_depth: Optional[int] = None
     
     # Extraction options
-    extraction_type: Optional[str] = None
+    extraction_type: Optional[Literal['basic', 'article', 'custom']] = None
     css_selector: Optional[str] = None
-    
-    @field_validator('url')
-    def validate_url(cls, v):
-        # Simple URL validation
-        if not v.startswith(('http://', 'https://')):
-            raise ValueError('URL must start with http:// or https://')
-        return v
-    
-    @field_validator('browser_type')
-    def validate_browser_type(cls, v):
-        if v and v not in ['chromium', 'firefox', 'webkit']:
-            raise ValueError('Browser type must be one of: chromium, firefox, webkit')
-        return v
-    
-    @field_validator('extraction_type')
-    def validate_extraction_type(cls, v):
-        if v and v not in ['basic', 'article', 'custom']:
-            raise ValueError('Extraction type must be one of: basic, article, custom')
-        return v
 
 class CrawlResponse(BaseModel):
     site_id: int
@@ -71,72 +104,55 @@ class CrawlResponse(BaseModel):
     status: str
     next_steps: Dict[str, str]
 
+@lru_cache(maxsize=4096)
+def _site_name(url: str) -> str:
+    """Generate a site name from a URL, reusing the names of URLs seen before."""
+    return get_crawler().generate_site_name(url)
+
+# CrawlRequest fields passed through to crawl_site / crawl_sitemap as keyword arguments
+_ADVANCED_OPTION_KEYS = frozenset((
+    "follow_external_links", "include_patterns", "exclude_patterns",
+    "headless", "browser_type", "proxy", "javascript_enabled", "user_agent",
+    "timeout", "wait_for_selector", "wait_for_timeout",
+    "download_images", "download_videos", "download_files",
+    "follow_redirects", "max_depth", "extraction_type", "css_selector",
+))
+
+def _needs_description(site_description: Optional[str], stored_description: Optional[str]) -> bool:
+    """Check whether the AI should generate a description for the site."""
+    return not site_description and (not stored_description or stored_description == _AI_PLACEHOLDER)
+
+def _next_steps(site_id: int) -> Dict[str, str]:
+    """Build the endpoints for working with a crawled site's content."""
+    return {
+        "view_pages": f"GET /api/sites/{site_id}/pages",
+        "search_content": f"GET /api/search/?query=your_query&site_id={site_id}"
+    }
+
 # Background task for crawling
-def crawl_in_background(
-    url: str, 
-    site_name: Optional[str], 
-    site_description: Optional[str], 
-    is_sitemap: bool, 
-    max_urls: Optional[int],
-    follow_external_links: Optional[bool] = None,
-    include_patterns: Optional[List[str]] = None,
-    exclude_patterns: Optional[List[str]] = None,
-    headless: Optional[bool] = None,
-    browser_type: Optional[str] = None,
-    proxy: Optional[str] = None,
-    javascript_enabled: Optional[bool] = None,
-    user_agent: Optional[str] = None,
-    timeout: Optional[int] = None,
-    wait_for_selector: Optional[str] = None,
-    wait_for_timeout: Optional[int] = None,
-    download_images: Optional[bool] = None,
-    download_videos: Optional[bool] = None,
-    download_files: Optional[bool] = None,
-    follow_redirects: Optional[bool] = None,
-    max_depth: Optional[int] = None,
-    extraction_type: Optional[str] = None,
-    css_selector: Optional[str] = None
-):
+def crawl_in_background(crawl_data: CrawlRequest, site_id: Optional[int] = None,
+                        needs_description: bool = False):
     try:
+        # Each crawl gets its own crawler: the content enhancer's async OpenAI client
+        # is tied to the event loop the crawl runs in, so it can't be shared
         crawler = WebCrawler()
         
-        # Get the site ID from the database
-        existing_site = crawler.db_client.get_site_by_url(url)
-        if existing_site:
-            site_id = existing_site['id']
-            
-            # Check if we need to generate a description
-            needs_description = (
-                not site_description and 
-                (not existing_site.get('description') or 
-                 existing_site.get('description') == "AI is generating a description... (refresh in a moment)")
-            )
-            
-            # Prepare advanced options
-            advanced_options = {
-                "follow_external_links": follow_external_links,
-                "include_patterns": include_patterns,
-                "exclude_patterns": exclude_patterns,
-                "headless": headless,
-                "browser_type": browser_type,
-                "proxy": proxy,
-                "javascript_enabled": javascript_enabled,
-                "user_agent": user_agent,
-                "timeout": timeout,
-                "wait_for_selector": wait_for_selector,
-                "wait_for_timeout": wait_for_timeout,
-                "download_images": download_images,
-                "download_videos": download_videos,
-                "download_files": download_files,
-                "follow_redirects": follow_redirects,
-                "max_depth": max_depth,
-                "extraction_type": extraction_type,
-                "css_selector": css_selector
-            }
-            
-            # Remove None values
-            advanced_options = {k: v for k, v in advanced_options.items() if v is not None}
-            
+        # Pass on only the advanced options that were set
+        advanced_options = crawl_data.model_dump(include=_ADVANCED_OPTION_KEYS, exclude_none=True)
+        url = crawl_data.url
+        site_name = crawl_data.site_name
+        site_description = crawl_data.site_description
+        is_sitemap = crawl_data.is_sitemap
+        max_urls = crawl_data.max_urls
+        
+        # Get the site ID from the database, unless the request handler resolved it
+        if site_id is None:
+            existing_site = crawler.db_client.get_site_by_url(url)
+            if existing_site:
+                site_id = existing_site['id']
+                needs_description = _needs_description(site_description, existing_site.get('description'))
+        
+        if site_id is not None:
             # Only proceed with crawling, the site already exists with the description
             if is_sitemap:
                 # Pass needs_description=True to force description generation
@@ -161,31 +177,6 @@ def crawl_in_background(
             # This shouldn't happen as we create the site before starting the background task,
             # but just in case, create the site and crawl
             
-            # Prepare advanced options
-            advanced_options = {
-                "follow_external_links": follow_external_links,
-                "include_patterns": include_patterns,
-                "exclude_patterns": exclude_patterns,
-                "headless": headless,
-                "browser_type": browser_type,
-                "proxy": proxy,
-                "javascript_enabled": javascript_enabled,
-                "user_agent": user_agent,
-                "timeout": timeout,
-                "wait_for_selector": wait_for_selector,
-                "wait_for_timeout": wait_for_timeout,
-                "download_images": download_images,
-                "download_videos": download_videos,
-                "download_files": download_files,
-                "follow_redirects": follow_redirects,
-                "max_depth": max_depth,
-                "extraction_type": extraction_type,
-                "css_selector": css_selector
-            }
-            
-            # Remove None values
-            advanced_options = {k: v for k, v in advanced_options.items() if v is not None}
-            
             if is_sitemap:
                 site_id = crawler.crawl_sitemap(
                     url, 
@@ -202,28 +193,27 @@ def crawl_in_background(
                     **advanced_options
                 )
             
+        # The crawl may have renamed or described the site, so don't serve it from the cache
+        crawler.db_client.invalidate_site(site_id)
+        
         # Get the final page count
-        page_count = crawler.db_client.get_page_count_by_site_id(site_id, include_chunks=True)
-        parent_page_count = crawler.db_client.get_page_count_by_site_id(site_id, include_chunks=False)
+        page_count, parent_page_count = crawler.db_client.get_page_counts_by_site_id(site_id)
         
-        # Print a completion message
-        print("\n" + "="*80)
-        print("✅  CRAWL COMPLETED SUCCESSFULLY!")
-        print("="*80)
-        print(f"📊  Site ID: {site_id}")
-        print(f"📄  Pages crawled: {parent_page_count}")
-        print(f"🧩  Total chunks: {page_count - parent_page_count}")
-        print(f"🔍  To check status: GET /api/crawl/status/{site_id}")
-        print(f"📚  To view pages: GET /api/sites/{site_id}/pages")
-        print(f"🔎  To search content: GET /api/search/?query=your_query&site_id={site_id}")
-        print("="*80 + "\n")
+        # Log a completion message
+        logger.info(
+            "Crawl completed for site %s: %d pages, %d chunks. "
+            "Status: GET /api/crawl/status/%s, pages: GET /api/sites/%s/pages, "
+            "search: GET /api/search/?query=your_query&site_id=%s",
+            site_id, parent_page_count, page_count - parent_page_count, site_id, site_id, site_id
+        )
     except Exception as e:
-        print(f"Error in background crawl task: {str(e)}")
+        logger.exception("Error in background crawl task: %s", e)
 
-@router.post("", response_model=CrawlResponse)
+@router.post("", response_class=ORJSONResponse, responses={200: {"model": CrawlResponse}})
+@catch_errors("Error starting crawl")
 async def crawl(
-    background_tasks: BackgroundTasks,
     crawl_data: CrawlRequest = Body(...),
+    crawler: WebCrawler = Depends(get_crawler),
 ):
     """
     Crawl a website or sitemap.
@@ -264,32 +254,45 @@ async def crawl(
     
     The crawling process will be executed in the background.
     """
+    # Refuse new crawls while the queue is full
+    if not _crawl_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many crawls in progress, try again later"
+        )
+    
+    submitted = False
     try:
-        crawler = WebCrawler()
-        
-        # Check if the site already exists
-        existing_site = crawler.db_client.get_site_by_url(crawl_data.url)
+        # Check if the site already exists (database calls block, so they run in the threadpool)
+        existing_site = await run_in_threadpool(crawler.db_client.get_site_by_url, crawl_data.url)
         site_id = None
+        description = None
         
         if existing_site:
-            print(f"Site already exists with ID: {existing_site['id']}. Updating existing site.")
+            logger.info("Site already exists with ID: %s. Updating existing site.", existing_site['id'])
             site_id = existing_site['id']
+            site_name = existing_site.get('name', "")
             
             # Update the site description if provided
+            description = existing_site.get('description')
             if crawl_data.site_description:
-                crawler.db_client.update_site_description(site_id, crawl_data.site_description)
-            elif not existing_site.get('description'):
+                description = crawl_data.site_description
+                await run_in_threadpool(crawler.db_client.update_site_description, site_id, description)
+            elif not description:
                 # Set a placeholder indicating an AI description is coming
-                crawler.db_client.update_site_description(site_id, "AI is generating a description... (refresh in a moment)")
+                description = _AI_PLACEHOLDER
+                await run_in_threadpool(crawler.db_client.update_site_description, site_id, description)
         else:
             # Create the site with the provided description or a placeholder
             description = crawl_data.site_description
             if not description:
                 # Set a placeholder indicating an AI description is coming
-                description = "AI is generating a description... (refresh in a moment)"
+                description = _AI_PLACEHOLDER
                 
-            site_id = crawler.db_client.add_site(
-                crawl_data.site_name or crawler.generate_site_name(crawl_data.url),
+            site_name = crawl_data.site_name or _site_name(crawl_data.url)
+            site_id = await run_in_threadpool(
+                crawler.db_client.add_site,
+                site_name,
                 crawl_data.url,
                 description
             )
@@ -297,7 +300,8 @@ async def crawl(
         # Start the crawl process
         if crawl_data.is_sitemap:
             if not site_id:
-                site_id = crawler.crawl_sitemap(
+                site_id = await run_in_threadpool(
+                    crawler.crawl_sitemap,
                     crawl_data.url, 
                     crawl_data.site_name, 
                     crawl_data.site_description, 
@@ -306,64 +310,45 @@ async def crawl(
                 )
         else:
             if not site_id:
-                site_id = crawler.crawl_site(
+                site_id = await run_in_threadpool(
+                    crawler.crawl_site,
                     crawl_data.url, 
                     crawl_data.site_name, 
                     crawl_data.site_description,
                     start_only=True  # Only start the crawl, don't wait for completion
                 )
         
-        # Add the full crawl to background tasks
-        background_tasks.add_task(
-            crawl_in_background,
-            crawl_data.url,
-            crawl_data.site_name,
-            crawl_data.site_description,
-            crawl_data.is_sitemap,
-            crawl_data.max_urls,
-            crawl_data.follow_external_links,
-            crawl_data.include_patterns,
-            crawl_data.exclude_patterns,
-            crawl_data.headless,
-            crawl_data.browser_type,
-            crawl_data.proxy,
-            crawl_data.javascript_enabled,
-            crawl_data.user_agent,
-            crawl_data.timeout,
-            crawl_data.wait_for_selector,
-            crawl_data.wait_for_timeout,
-            crawl_data.download_images,
-            crawl_data.download_videos,
-            crawl_data.download_files,
-            crawl_data.follow_redirects,
-            crawl_data.max_depth,
-            crawl_data.extraction_type,
-            crawl_data.css_selector
+        # Queue the full crawl with the resolved site, so the task doesn't have to
+        # look it up again; its slot is freed when it finishes
+        future = _crawl_executor.submit(
+            crawl_in_background, crawl_data, site_id,
+            _needs_description(crawl_data.site_description, description)
         )
+        with _crawl_futures_lock:
+            _crawl_futures[future] = site_id
+        future.add_done_callback(_crawl_done)
+        submitted = True
         
-        # Get site details
-        site = crawler.db_client.get_site_by_id(site_id)
-        
-        return CrawlResponse(
-            site_id=site_id,
-            site_name=site.get("name", ""),
-            url=site.get("url", ""),
-            message="Crawl started successfully",
-            status="in_progress",
-            next_steps={
+        # Build the CrawlResponse shape as a plain dict from what the handler
+        # already knows about the site, without reading it back
+        return ORJSONResponse({
+            "site_id": site_id,
+            "site_name": site_name,
+            "url": existing_site.get("url", "") if existing_site else crawl_data.url,
+            "message": "Crawl started successfully",
+            "status": "in_progress",
+            "next_steps": {
                 "check_status": f"GET /api/crawl/status/{site_id}",
-                "view_pages": f"GET /api/sites/{site_id}/pages",
-                "search_content": f"GET /api/search/?query=your_query&site_id={site_id}"
+                **_next_steps(site_id)
             }
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error starting crawl: {str(e)}"
-        )
+        })
+    finally:
+        if not submitted:
+            _crawl_slots.release()
 
-@router.get("/status/{site_id}", response_model=Dict[str, Any])
-async def crawl_status(site_id: int):
+@router.get("/status/{site_id}", response_class=ORJSONResponse)
+@catch_errors("Error getting crawl status")
+async def crawl_status(site_id: int, crawler: WebCrawler = Depends(get_crawler)):
     """
     Get the status of a crawl by site ID.
     
@@ -372,40 +357,29 @@ async def crawl_status(site_id: int):
     Returns detailed information about the site, including the number of pages crawled,
     chunks created, and suggested next steps for working with the crawled content.
     """
-    try:
-        crawler = WebCrawler()
-        
-        # Get site details
-        site = crawler.db_client.get_site_by_id(site_id)
-        if not site:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Site with ID {site_id} not found"
-            )
-        
-        # Get page count
-        page_count = crawler.db_client.get_page_count_by_site_id(site_id)
-        parent_page_count = crawler.db_client.get_page_count_by_site_id(site_id, include_chunks=False)
-        chunk_count = page_count - parent_page_count
-        
-        return {
-            "site_id": site_id,
-            "site_name": site.get("name", ""),
-            "url": site.get("url", ""),
-            "page_count": parent_page_count,
-            "chunk_count": chunk_count,
-            "total_count": page_count,
-            "created_at": site.get("created_at", ""),
-            "updated_at": site.get("updated_at", ""),
-            "next_steps": {
-                "view_pages": f"GET /api/sites/{site_id}/pages",
-                "search_content": f"GET /api/search/?query=your_query&site_id={site_id}"
-            }
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
+    # Get the site details and its page and parent page counts concurrently
+    # (database calls block, so they run in the threadpool)
+    site, (page_count, parent_page_count) = await asyncio.gather(
+        run_in_threadpool(crawler.db_client.get_site_by_id, site_id),
+        run_in_threadpool(crawler.db_client.get_page_counts_by_site_id, site_id)
+    )
+    if not site:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error getting crawl status: {str(e)}"
-        ) 
\ No newline at end of file
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Site with ID {site_id} not found"
+        )
+    
+    chunk_count = page_count - parent_page_count
+    
+    # Return the status as orjson directly; it's polled often and needs no validation
+    return ORJSONResponse({
+        "site_id": site_id,
+        "site_name": site.get("name", ""),
+        "url": site.get("url", ""),
+        "page_count": parent_page_count,
+        "chunk_count": chunk_count,
+        "total_count": page_count,
+        "created_at": site.get("created_at", ""),
+        "updated_at": site.get("updated_at", ""),
+        "next_steps": _next_steps(site_id)
+    }) 
\ No newline at end of file
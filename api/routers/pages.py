@@ -1,16 +1,14 @@
-from fastapi import APIRouter, Query, HTTPException, status, Path, Depends
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
+import logging
 
 # Import from main project
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from db_client import SupabaseClient
+from api.deps import get_db_client
 
-# Create a function to get the db client
-def get_db_client():
-    return SupabaseClient()
+logger = logging.getLogger(__name__)
 
 # Create router
 router = APIRouter(
@@ -32,19 +30,11 @@ class Page(BaseModel):
     created_at: Optional[str] = None
     updated_at: Optional[str] = None
     
-    class Config:
-        arbitrary_types_allowed = True
-        
+    @field_validator('created_at', 'updated_at', mode='before')
     @classmethod
-    def from_dict(cls, page_dict):
-        """Create a Page from a dictionary, converting datetime to string if needed."""
-        if 'created_at' in page_dict and page_dict['created_at'] is not None:
-            if not isinstance(page_dict['created_at'], str):
-                page_dict['created_at'] = str(page_dict['created_at'])
-        if 'updated_at' in page_dict and page_dict['updated_at'] is not None:
-            if not isinstance(page_dict['updated_at'], str):
-                page_dict['updated_at'] = str(page_dict['updated_at'])
-        return cls(**page_dict)
+    def _timestamp_to_str(cls, value):
+        """Convert datetimes from the database to strings."""
+        return value if value is None or isinstance(value, str) else str(value)
 
 class PageDetail(Page):
     site_name: Optional[str] = None
@@ -59,15 +49,16 @@ async def get_page_by_id(page_id: int, db_client: SupabaseClient = Depends(get_d
     """
     Get a page by ID.
     """
-    print(f"Fetching page with ID: {page_id}")
+    logger.debug("Fetching page with ID: %s", page_id)
     try:
-        page = db_client.get_page_by_id(page_id)
-        print(f"Page result: {page}")
+        page = await run_in_threadpool(db_client.get_page_by_id, page_id)
         if not page:
             raise HTTPException(status_code=404, detail=f"Page with ID {page_id} not found")
         return page
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in get_page_by_id: {e}")
+        logger.exception("Error in get_page_by_id: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.get("/{page_id}/chunks", response_model=List[Page])
@@ -75,11 +66,10 @@ async def get_chunks_by_parent_id(page_id: int, db_client: SupabaseClient = Depe
     """
     Get all chunks for a specific parent page.
     """
-    print(f"Fetching chunks for parent ID: {page_id}")
+    logger.debug("Fetching chunks for parent ID: %s", page_id)
     try:
-        chunks = db_client.get_chunks_by_parent_id(page_id)
-        print(f"Chunks result: {chunks}")
+        chunks = await run_in_threadpool(db_client.get_chunks_by_parent_id, page_id)
         return chunks
     except Exception as e:
-        print(f"Error in get_chunks_by_parent_id: {e}")
+        logger.exception("Error in get_chunks_by_parent_id: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Query, HTTPException, status
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
-import json
+from fastapi import APIRouter, Query, HTTPException, status, Depends
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
+from pydantic import BaseModel, TypeAdapter
 
 # Import from main project
 from crawler import WebCrawler
+from api.deps import get_crawler
 
 # Create router
 router = APIRouter()
@@ -22,6 +23,9 @@ class SearchResult(BaseModel):
     parent_id: Optional[int] = None
     parent_title: Optional[str] = None
 
+# Validates all results of a search at once
+_SEARCH_RESULTS_ADAPTER = TypeAdapter(List[SearchResult])
+
 class SearchResponse(BaseModel):
     results: List[SearchResult]
     count: int
@@ -35,7 +39,8 @@ async def search(
     threshold: float = Query(0.3, description="Similarity threshold (0-1)"),
     limit: int = Query(10, description="Maximum number of results"),
     text_only: bool = Query(False, description="Use text search instead of embeddings"),
-    site_id: Optional[int] = Query(None, description="Optional site ID to filter results by")
+    site_id: Optional[int] = Query(None, description="Optional site ID to filter results by"),
+    crawler: WebCrawler = Depends(get_crawler),
 ):
     """
     Search for content using semantic search or text search.
@@ -47,8 +52,9 @@ async def search(
     - **site_id**: Optional site ID to filter results by
     """
     try:
-        crawler = WebCrawler()
-        results = crawler.search(
+        # The embedding request and database search block, so they run in the threadpool
+        results = await run_in_threadpool(
+            crawler.search,
             query=query,
             use_embedding=not text_only,
             threshold=threshold,
@@ -56,21 +62,8 @@ async def search(
             site_id=site_id
         )
         
-        # Convert results to SearchResult model
-        search_results = []
-        for result in results:
-            search_results.append(SearchResult(
-                id=result.get("id"),
-                url=result.get("url"),
-                title=result.get("title"),
-                snippet=result.get("snippet"),
-                similarity=result.get("similarity"),
-                context=result.get("context"),
-                is_chunk=result.get("is_chunk"),
-                chunk_index=result.get("chunk_index"),
-                parent_id=result.get("parent_id"),
-                parent_title=result.get("parent_title")
-            ))
+        # Convert results to SearchResult models
+        search_results = _SEARCH_RESULTS_ADAPTER.validate_python(results)
         
         return SearchResponse(
             results=search_results,
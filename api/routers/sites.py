@@ -1,14 +1,28 @@
-from fastapi import APIRouter, Query, HTTPException, status, Path
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
+from fastapi import APIRouter, Query, HTTPException, status, Path, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Optional, Tuple
+from pydantic import BaseModel, TypeAdapter, field_validator
+import asyncio
+import orjson
 
 # Import from main project
-from crawler import WebCrawler
 from db_client import SupabaseClient
+from api.deps import get_db_client
 
 # Create router
 router = APIRouter()
 
+# The last site list built for each include_chunks value, with its ETag
+_site_list_cache: Dict[bool, Tuple[str, "SiteList"]] = {}
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Check whether the request's If-None-Match header matches the ETag."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return any(tag.strip() in (etag, "*") for tag in if_none_match.split(","))
+
 # Define models
 class Site(BaseModel):
     id: int
@@ -19,19 +33,11 @@ class Site(BaseModel):
     updated_at: Optional[str] = None
     page_count: Optional[int] = None
     
-    class Config:
-        arbitrary_types_allowed = True
-        
+    @field_validator('created_at', 'updated_at', mode='before')
     @classmethod
-    def from_dict(cls, site_dict):
-        """Create a Site from a dictionary, converting datetime to string if needed."""
-        if 'created_at' in site_dict and site_dict['created_at'] is not None:
-            if not isinstance(site_dict['created_at'], str):
-                site_dict['created_at'] = str(site_dict['created_at'])
-        if 'updated_at' in site_dict and site_dict['updated_at'] is not None:
-            if not isinstance(site_dict['updated_at'], str):
-                site_dict['updated_at'] = str(site_dict['updated_at'])
-        return cls(**site_dict)
+    def _timestamp_to_str(cls, value):
+        """Convert datetimes from the database to strings."""
+        return value if value is None or isinstance(value, str) else str(value)
 
 class SiteList(BaseModel):
     sites: List[Site]
@@ -48,19 +54,11 @@ class Page(BaseModel):
     created_at: Optional[str] = None
     updated_at: Optional[str] = None
     
-    class Config:
-        arbitrary_types_allowed = True
-        
+    @field_validator('created_at', 'updated_at', mode='before')
     @classmethod
-    def from_dict(cls, page_dict):
-        """Create a Page from a dictionary, converting datetime to string if needed."""
-        if 'created_at' in page_dict and page_dict['created_at'] is not None:
-            if not isinstance(page_dict['created_at'], str):
-                page_dict['created_at'] = str(page_dict['created_at'])
-        if 'updated_at' in page_dict and page_dict['updated_at'] is not None:
-            if not isinstance(page_dict['updated_at'], str):
-                page_dict['updated_at'] = str(page_dict['updated_at'])
-        return cls(**page_dict)
+    def _timestamp_to_str(cls, value):
+        """Convert datetimes from the database to strings."""
+        return value if value is None or isinstance(value, str) else str(value)
 
 class PageList(BaseModel):
     pages: List[Page]
@@ -68,31 +66,53 @@ class PageList(BaseModel):
     site_id: int
     site_name: str
 
+# Validate whole lists of database rows at once
+_SITE_LIST_ADAPTER = TypeAdapter(List[Site])
+_PAGE_LIST_ADAPTER = TypeAdapter(List[Page])
+
 @router.get("", response_model=SiteList)
 async def list_sites(
-    include_chunks: bool = Query(False, description="Include chunks in page count")
+    request: Request,
+    response: Response,
+    include_chunks: bool = Query(False, description="Include chunks in page count"),
+    db_client: SupabaseClient = Depends(get_db_client),
 ):
     """
     List all crawled sites.
     
     - **include_chunks**: Whether to include chunks in the page count
+    
+    Responses carry an ETag; send it back in If-None-Match to get a 304 while the sites are unchanged.
     """
     try:
-        db_client = SupabaseClient()
-        sites = db_client.get_all_sites()
+        # The list only changes when sites or pages are added, so check that first
+        version = await run_in_threadpool(db_client.get_sites_version)
+        etag = f'"{version}-{int(include_chunks)}"'
+        if _etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        
+        # Reuse the list built for the same version
+        cached = _site_list_cache.get(include_chunks)
+        if cached and cached[0] == etag:
+            return cached[1]
         
-        # Get page count for each site
-        site_list = []
-        for site in sites:
-            page_count = db_client.get_page_count_by_site_id(site["id"], include_chunks=include_chunks)
-            site_data = site.copy()
-            site_data["page_count"] = page_count
-            site_list.append(Site.from_dict(site_data))
+        # Get the sites and the page counts of all sites concurrently (database calls
+        # block, so they run in the threadpool)
+        sites, page_counts = await asyncio.gather(
+            run_in_threadpool(db_client.get_all_sites),
+            run_in_threadpool(db_client.get_site_page_counts, include_chunks=include_chunks)
+        )
+        site_list = _SITE_LIST_ADAPTER.validate_python(
+            [{**site, "page_count": page_counts.get(site["id"], 0)} for site in sites]
+        )
         
-        return SiteList(
+        result = SiteList(
             sites=site_list,
             count=len(site_list)
         )
+        _site_list_cache[include_chunks] = (etag, result)
+        return result
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -102,7 +122,8 @@ async def list_sites(
 @router.get("/{site_id}", response_model=Site)
 async def get_site(
     site_id: int = Path(..., description="The ID of the site"),
-    include_chunks: bool = Query(False, description="Include chunks in page count")
+    include_chunks: bool = Query(False, description="Include chunks in page count"),
+    db_client: SupabaseClient = Depends(get_db_client),
 ):
     """
     Get a site by ID.
@@ -111,8 +132,12 @@ async def get_site(
     - **include_chunks**: Whether to include chunks in the page count
     """
     try:
-        db_client = SupabaseClient()
-        site = db_client.get_site_by_id(site_id)
+        # Get the site and its page count concurrently (database calls block, so they
+        # run in the threadpool)
+        site, page_count = await asyncio.gather(
+            run_in_threadpool(db_client.get_site_by_id, site_id),
+            run_in_threadpool(db_client.get_page_count_by_site_id, site_id, include_chunks=include_chunks)
+        )
         
         if not site:
             raise HTTPException(
@@ -120,12 +145,7 @@ async def get_site(
                 detail=f"Site with ID {site_id} not found"
             )
         
-        # Get page count
-        page_count = db_client.get_page_count_by_site_id(site_id, include_chunks=include_chunks)
-        
-        site_data = site.copy()
-        site_data["page_count"] = page_count
-        return Site.from_dict(site_data)
+        return Site.model_validate({**site, "page_count": page_count})
     except HTTPException:
         raise
     except Exception as e:
@@ -138,7 +158,8 @@ async def get_site(
 async def get_site_pages(
     site_id: int = Path(..., description="The ID of the site"),
     include_chunks: bool = Query(False, description="Include chunks in the results"),
-    limit: int = Query(100, description="Maximum number of pages to return")
+    limit: int = Query(100, description="Maximum number of pages to return"),
+    db_client: SupabaseClient = Depends(get_db_client),
 ):
     """
     Get pages for a specific site.
@@ -148,29 +169,25 @@ async def get_site_pages(
     - **limit**: Maximum number of pages to return
     """
     try:
-        # Get pages
-        crawler = WebCrawler()
-        pages = crawler.get_site_pages(site_id, limit=limit, include_chunks=include_chunks)
-        
-        # Get site name
-        db_client = SupabaseClient()
-        site = db_client.get_site_by_id(site_id)
-        if not site:
+        # Get the site name and pages in one query
+        site_pages = await run_in_threadpool(
+            db_client.get_site_with_pages, site_id, limit=limit, include_chunks=include_chunks
+        )
+        if not site_pages:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Site with ID {site_id} not found"
             )
+        site_name, pages = site_pages
         
-        # Convert to Page model
-        page_list = []
-        for page in pages:
-            page_list.append(Page.from_dict(page))
+        # Convert to Page models
+        page_list = _PAGE_LIST_ADAPTER.validate_python(pages)
         
         return PageList(
             pages=page_list,
             count=len(page_list),
             site_id=site_id,
-            site_name=site["name"]
+            site_name=site_name
         )
     except HTTPException:
         raise
@@ -178,4 +195,28 @@ async def get_site_pages(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error getting site pages: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+@router.get("/{site_id}/pages.ndjson")
+async def stream_site_pages(
+    site_id: int = Path(..., description="The ID of the site"),
+    include_chunks: bool = Query(False, description="Include chunks in the results"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of pages to return (all by default)"),
+    db_client: SupabaseClient = Depends(get_db_client),
+):
+    """
+    Stream the pages of a site as newline-delimited JSON, one page per line.
+    
+    - **site_id**: The ID of the site
+    - **include_chunks**: Whether to include chunks in the results
+    - **limit**: Maximum number of pages to return
+    
+    Pages are sent as they are read from the database, so large sites can be exported
+    without building the whole response first. An unknown site gives an empty response.
+    """
+    def page_lines():
+        # StreamingResponse iterates this in the threadpool, so the blocking reads are fine
+        for page in db_client.iter_site_pages(site_id, limit=limit, include_chunks=include_chunks):
+            yield orjson.dumps(page) + b"\n"
+    
+    return StreamingResponse(page_lines(), media_type="application/x-ndjson")
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+"""
+Production entrypoint for the Supa-Crawl-Chat API.
+
+Runs the app under Gunicorn with Uvicorn workers (python -m api.serve).
+"""
+
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+if __name__ == "__main__":
+    # Get port from environment variable or use default
+    port = os.getenv("API_PORT", "8001")
+
+    # Default to 2 * cores + 1 workers
+    workers = os.getenv("API_WORKERS") or str((os.cpu_count() or 1) * 2 + 1)
+    
+    # Let each worker size its database pool by the real number of workers
+    os.environ["API_WORKERS"] = workers
+
+    # Replace this process with Gunicorn so it receives signals directly
+    os.execvp("gunicorn", [
+        "gunicorn", "api.main:app",
+        "-k", "uvicorn.workers.UvicornWorker",
+        "-w", workers,
+        "--worker-connections", "1000",
+        "--bind", f"0.0.0.0:{port}",
+        "--keep-alive", "30",
+    ])
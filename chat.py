@@ -4,7 +4,6 @@ Chat interface for interacting with crawled data using an LLM.
 
 import os
 import argparse
-import uuid
 import json
 import yaml
 import glob
@@ -24,7 +23,7 @@ import sys
 from rich.progress import Progress, SpinnerColumn, TextColumn
 import time
 
-from utils import print_success, print_error, print_warning, print_info
+from utils import print_success, print_error, print_warning, print_info, new_session_id
 
 # Create a rich console
 console = Console()
@@ -101,6 +100,14 @@ def restore_verbose_mode():
     embeddings.print_error = original_print_error
     embeddings.print_success = original_print_success
 
+# Greeting words and phrases, matched as whole words anywhere in a message so that
+# e.g. "this" or "ship" don't count as a greeting
+GREETING_RE = re.compile(
+    r"\b(?:hi|hello|hey|greetings|howdy|hola|how are you|how's it going|what's up|sup"
+    r"|good morning|good afternoon|good evening)\b",
+    re.IGNORECASE
+)
+
 # Define default chat profiles (fallback if files not found)
 DEFAULT_PROFILES = {
     "default": {
@@ -183,7 +190,7 @@ class ChatBot:
                 session_id: Optional[str] = None,
                 user_id: Optional[str] = None,
                 profile: str = "default",
-                profiles_dir: str = "profiles",
+                profiles_dir: Optional[str] = None,
                 verbose: bool = False):
         """Initialize the chat interface.
         
@@ -194,7 +201,7 @@ class ChatBot:
             session_id: Session ID for the conversation.
             user_id: User ID for the conversation.
             profile: Profile to use for the conversation.
-            profiles_dir: Directory containing profile YAML files.
+            profiles_dir: Directory containing profile YAML files. Defaults to environment variable.
             verbose: Whether to show verbose output.
         """
         # Set verbose output flag
@@ -245,7 +252,7 @@ class ChatBot:
             if env_session_id and env_session_id.strip():
                 self.session_id = env_session_id
             else:
-                self.session_id = str(uuid.uuid4())
+                self.session_id = new_session_id()
                 console.print(f"Generated new session ID: {self.session_id}")
         
         # Set up the user ID
@@ -305,11 +312,16 @@ class ChatBot:
             all_preferences = []
             
             for message in db_messages:
+                # Store timestamps as strings once here so readers don't have to convert them
+                timestamp = message.get("timestamp", "")
+                if timestamp is not None and not isinstance(timestamp, str):
+                    timestamp = str(timestamp)
+                
                 # Add the message to the conversation history
                 self.conversation_history.append({
                     "role": message["role"],
                     "content": message["content"],
-                    "timestamp": message.get("timestamp", ""),
+                    "timestamp": timestamp,
                     "metadata": message.get("metadata", {})
                 })
                 
@@ -1143,11 +1155,73 @@ Extract up to 3 key preferences or details, prioritizing the most salient ones.
         
         return context
     
-    def get_response(self, query: str) -> str:
+    def get_response(self, query: str, on_token: Optional[Callable[[str], None]] = None) -> str:
         """Get a response from the LLM based on the query and relevant context.
         
         Args:
             query: The user's query.
+            on_token: Optional callback that receives the response text as it is
+                generated. Responses that don't come from the LLM are passed in one piece.
+            
+        Returns:
+            The LLM's response.
+        """
+        if on_token is None:
+            return self._generate_response(query)
+        
+        streamed = []
+        
+        def emit(token: str):
+            streamed.append(token)
+            on_token(token)
+        
+        response_text = self._generate_response(query, emit)
+        if not streamed:
+            on_token(response_text)
+        return response_text
+    
+    def _complete(self, messages: List[Dict[str, str]], max_tokens: int,
+                  on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Run a chat completion, streaming it to on_token if provided.
+        
+        Args:
+            messages: The messages to send to the LLM.
+            max_tokens: Maximum number of tokens to generate.
+            on_token: Optional callback that receives each piece of generated text.
+            
+        Returns:
+            The full response text.
+        """
+        if on_token is None:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens
+            )
+            return response.choices[0].message.content
+        
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        parts = []
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                token = chunk.choices[0].delta.content
+                parts.append(token)
+                on_token(token)
+        return "".join(parts)
+    
+    def _generate_response(self, query: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Generate the response for get_response.
+        
+        Args:
+            query: The user's query.
+            on_token: Optional callback that receives LLM output as it is generated.
             
         Returns:
             The LLM's response.
@@ -1158,19 +1232,10 @@ Extract up to 3 key preferences or details, prioritizing the most salient ones.
         clean_query = query.strip().lower()
         
         # Check for simple greetings first - use exact word matching to avoid false positives
-        greeting_patterns = [
-            "hi", "hello", "hey", "greetings", "howdy", "hola", 
-            "how are you", "how's it going", "what's up", "sup", 
-            "good morning", "good afternoon", "good evening"
-        ]
-        
-        is_greeting = False
-        for greeting in greeting_patterns:
-            # Use word boundary matching to avoid matching substrings
-            if re.search(r'\b' + greeting + r'\b', clean_query):
-                is_greeting = True
-                console.print(f"[dim]DEBUG: Detected greeting pattern: '{greeting}'[/dim]")
-                break
+        greeting = GREETING_RE.search(clean_query)
+        is_greeting = greeting is not None
+        if is_greeting:
+            console.print(f"[dim]DEBUG: Detected greeting pattern: '{greeting.group(0)}'[/dim]")
         
         # Add the user message to the conversation history
         self.add_user_message(query)
@@ -1229,14 +1294,7 @@ Extract up to 3 key preferences or details, prioritizing the most salient ones.
             
             try:
                 # Get response from LLM
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=150
-                )
-                
-                response_text = response.choices[0].message.content.strip()
+                response_text = self._complete(messages, 150, on_token).strip()
                 console.print(f"[dim]DEBUG: Got greeting response: '{response_text[:30]}...'[/dim]")
                 
                 # Add the assistant's response to the conversation history
@@ -1332,7 +1390,7 @@ Extract up to 3 key preferences or details, prioritizing the most salient ones.
                     
                     # Get response from LLM
                     messages = self._prepare_messages_for_llm(query, context_str, is_followup)
-                    response_text = self._get_llm_response(messages)
+                    response_text = self._get_llm_response(messages, on_token)
                     
                     # Add the assistant's response to the conversation history
                     self.add_assistant_message(response_text)
@@ -1638,15 +1696,7 @@ Always maintain continuity in the conversation.
         messages.append({"role": "system", "content": f"Context from database search:\n{context}"})
         
         # Get a response from the LLM
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1000
-        )
-        
-        # Extract the response text
-        response_text = response.choices[0].message.content
+        response_text = self._complete(messages, 1000, on_token)
         
         # Add the assistant's response to the conversation history
         self.add_assistant_message(response_text)
@@ -2209,11 +2259,13 @@ For example, change 'https://example.com/page/#chunk-0' to 'https://example.com/
         
         return messages
     
-    def _get_llm_response(self, messages: List[Dict[str, str]]) -> str:
+    def _get_llm_response(self, messages: List[Dict[str, str]],
+                          on_token: Optional[Callable[[str], None]] = None) -> str:
         """Get a response from the LLM.
         
         Args:
             messages: The messages to send to the LLM.
+            on_token: Optional callback that receives the response as it is generated.
             
         Returns:
             The LLM's response.
@@ -2222,15 +2274,7 @@ For example, change 'https://example.com/page/#chunk-0' to 'https://example.com/
         
         try:
             # Get a response from the LLM
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1000
-            )
-            
-            # Extract the response text
-            response_text = response.choices[0].message.content
+            response_text = self._complete(messages, 1000, on_token)
             console.print(f"[dim]DEBUG: Got LLM response: '{response_text[:30]}...'[/dim]")
             
             return response_text
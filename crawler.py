@@ -5,6 +5,7 @@ import re
 import asyncio
 import xml.etree.ElementTree as ET
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional, Union
 from urllib.parse import urlparse
 from tqdm import tqdm
@@ -899,9 +900,7 @@ class WebCrawler:
             if 'exclude_patterns' in advanced_options:
                 crawl_options['exclude_patterns'] = advanced_options['exclude_patterns']
             
-            # Crawl each URL found in the sitemap
-            all_pages = []
-            for url in urls:
+            def crawl_url(url: str) -> List[Dict[str, Any]]:
                 print_info(f"Crawling URL from sitemap: {url}")
                 try:
                     # Crawl the individual URL
@@ -915,12 +914,21 @@ class WebCrawler:
                     pages = self.process_crawl_results(crawl_results)
                     
                     if pages:
-                        all_pages.extend(pages)
                         print_info(f"Successfully processed URL: {url}")
                     else:
                         print_warning(f"No content found for URL: {url}")
+                    return pages or []
                 except Exception as e:
                     print_error(f"Error crawling URL {url}: {e}")
+                    return []
+            
+            # Crawl each URL found in the sitemap. A crawl mostly waits for the
+            # Crawl4AI server, so a few run at once; pages keep the sitemap order
+            all_pages = []
+            concurrency = max(1, min(len(urls), int(os.getenv("CRAWL_SITEMAP_CONCURRENCY", "5"))))
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="sitemap") as executor:
+                for pages in executor.map(crawl_url, urls):
+                    all_pages.extend(pages)
             
             if not all_pages:
                 print_warning("No pages were successfully crawled from the sitemap.")
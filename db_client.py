@@ -1,8 +1,11 @@
 import os
 import json
-from typing import List, Dict, Any, Optional, Tuple, Union
-import psycopg2
+from typing import List, Dict, Any, Optional, Tuple, Union, Iterator
+import threading
+import time
+from collections import OrderedDict
 from psycopg2.extras import execute_values, Json
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from dotenv import load_dotenv
 from utils import print_info, print_warning, print_error, print_success
 from db_setup import db_params  # Import the db_params from db_setup.py
@@ -11,6 +14,122 @@ import re
 # Load environment variables
 load_dotenv()
 
+# Connection pools shared by every client with the same connection parameters
+_pools: Dict[Tuple, ThreadedConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+class TTLCache:
+    """A small thread-safe LRU cache whose entries expire after a fixed time."""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Get the value for a key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entry if the cache is full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+    
+    def pop(self, key):
+        """Remove a key from the cache."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+# Sites and pages by ID, shared by every client. Status polling reads the same site
+# many times a second, while rows only change during crawls
+_site_cache = TTLCache(1024, float(os.getenv("DB_SITE_CACHE_TTL", "5")))
+_page_cache = TTLCache(1024, float(os.getenv("DB_PAGE_CACHE_TTL", "30")))
+
+def _default_pool_size() -> int:
+    """Split DB_MAX_CONNECTIONS between the API worker processes.
+    
+    Every worker has its own pool, so a fixed per-process size multiplied by
+    the number of workers can exceed the server's max_connections. The API
+    entrypoints export the worker count they start as API_WORKERS; any other
+    process, such as the CLI, is a single process.
+    """
+    workers = int(os.getenv("API_WORKERS") or "1")
+    budget = int(os.getenv("DB_MAX_CONNECTIONS", "40"))
+    return max(2, budget // max(workers, 1))
+
+class _BlockingConnectionPool(ThreadedConnectionPool):
+    """A thread-safe pool that waits for a free connection instead of failing.
+    
+    psycopg2 raises PoolError as soon as every connection is in use; this pool
+    waits up to `timeout` seconds for one to be returned first.
+    """
+    
+    def __init__(self, minconn: int, maxconn: int, timeout: float, *args, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._timeout = timeout
+        super().__init__(minconn, maxconn, *args, **kwargs)
+    
+    def getconn(self, key=None):
+        """Get a free connection, waiting for one if the pool is exhausted."""
+        if not self._slots.acquire(timeout=self._timeout):
+            raise PoolError(f"connection pool exhausted after waiting {self._timeout}s")
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def putconn(self, conn=None, key=None, close=False):
+        """Put a connection back and wake up a waiting thread."""
+        super().putconn(conn, key, close)
+        self._slots.release()
+
+class _PooledConnection:
+    """A connection checked out of a pool.
+    
+    Behaves like the underlying psycopg2 connection, but close() returns it
+    to the pool instead of closing it.
+    """
+    
+    def __init__(self, pool: ThreadedConnectionPool, conn):
+        self._pool = pool
+        self._conn = conn
+    
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+    
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            return self._conn.__exit__(exc_type, exc_value, traceback)
+        finally:
+            self.close()
+    
+    def close(self):
+        """Return the connection to the pool."""
+        conn = self._conn
+        if conn is None:
+            return
+        self._conn = None
+        
+        # The pool rolls back any uncommitted work and drops broken connections
+        self._pool.putconn(conn, close=bool(conn.closed))
+
 class SupabaseClient:
     """Client for interacting with the Supabase database."""
     
@@ -35,9 +154,29 @@ class SupabaseClient:
             'password': password or db_params['password']
         }
     
+    def _get_pool(self) -> ThreadedConnectionPool:
+        """Get the connection pool for this client's connection parameters."""
+        key = tuple(sorted(self.db_params.items()))
+        pool = _pools.get(key)
+        if pool is None:
+            with _pools_lock:
+                pool = _pools.get(key)
+                if pool is None:
+                    size = int(os.getenv("DB_POOL_SIZE") or _default_pool_size())
+                    min_size = min(int(os.getenv("DB_POOL_MIN_SIZE", "2")), size)
+                    timeout = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+                    pool = _BlockingConnectionPool(min_size, size, timeout, **self.db_params)
+                    _pools[key] = pool
+        return pool
+    
     def _get_connection(self):
-        """Get a connection to the database."""
-        return psycopg2.connect(**self.db_params)
+        """Get a connection to the database from the shared pool.
+        
+        Waits for a connection to be returned when the pool is exhausted, and
+        raises PoolError if none is returned within DB_POOL_TIMEOUT seconds.
+        """
+        pool = self._get_pool()
+        return _PooledConnection(pool, pool.getconn())
     
     def add_site(self, name: str, url: str, description: Optional[str] = None) -> int:
         """Add a new site to the database.
@@ -66,6 +205,7 @@ class SupabaseClient:
                     (name, description, existing[0])
                 )
                 site_id = cur.fetchone()[0]
+                _site_cache.pop(site_id)
                 print_info(f"Updated existing site with ID: {site_id}")
             else:
                 # Insert the new site
@@ -159,6 +299,7 @@ class SupabaseClient:
                                 """,
                                 (title, content, summary, embedding_str, json.dumps(metadata) if metadata else None, page_id)
                             )
+                            _page_cache.pop(page_id)
                             print_info(f"Updated existing page: {url} (ID: {page_id})")
                         else:
                             # Insert new page
@@ -239,6 +380,7 @@ class SupabaseClient:
                                 """,
                                 (title, content, summary, embedding_str, json.dumps(metadata) if metadata else None, parent_id, chunk_id)
                             )
+                            _page_cache.pop(chunk_id)
                             print_info(f"Updated existing chunk: {url} (chunk {chunk_index}, ID: {chunk_id})")
                         else:
                             # Insert new chunk
@@ -733,11 +875,9 @@ class SupabaseClient:
         Returns:
             List of matching pages with combined scores.
         """
-        conn = None
+        # Each search takes its own connection, so don't hold one here: with a small
+        # pool, concurrent searches would wait on each other until they time out
         try:
-            conn = self._get_connection()
-            cur = conn.cursor()
-            
             # First try vector search with a lower threshold to get more results
             print_info(f"Performing vector search with threshold {threshold}...")
             vector_threshold = max(threshold * 0.7, 0.2)  # Lower threshold for vector search, but not below 0.2
@@ -825,9 +965,6 @@ class SupabaseClient:
             print_error(f"Error in hybrid search: {e}")
             # Fall back to text search
             return self.search_by_text(query, limit, site_id)
-        finally:
-            if conn:
-                conn.close()
     
     def get_site_by_url(self, url: str) -> Optional[Dict[str, Any]]:
         """Get a site by URL.
@@ -879,6 +1016,10 @@ class SupabaseClient:
         Returns:
             The site, or None if not found.
         """
+        cached = _site_cache.get(site_id)
+        if cached is not None:
+            return dict(cached)
+        
         conn = None
         try:
             conn = self._get_connection()
@@ -897,7 +1038,7 @@ class SupabaseClient:
             # Get the result
             row = cur.fetchone()
             if row:
-                return {
+                site = {
                     'id': row[0],
                     'name': row[1],
                     'url': row[2],
@@ -905,12 +1046,22 @@ class SupabaseClient:
                     'created_at': row[4],
                     'updated_at': row[5]
                 }
+                _site_cache.set(site_id, site)
+                return dict(site)
             
             return None
         finally:
             if conn:
                 conn.close()
     
+    def invalidate_site(self, site_id: int):
+        """Drop a site from the lookup cache so the next get_site_by_id reads it again.
+        
+        Args:
+            site_id: The ID of the site.
+        """
+        _site_cache.pop(site_id)
+    
     def get_page_count_by_site_id(self, site_id: int, include_chunks: bool = False) -> int:
         """Get the number of pages for a specific site.
         
@@ -949,25 +1100,92 @@ class SupabaseClient:
             if conn:
                 conn.close()
     
-    def get_pages_by_site_id(self, site_id: int, limit: int = 100, include_chunks: bool = False) -> List[Dict[str, Any]]:
-        """Get pages for a specific site.
+    def get_page_counts_by_site_id(self, site_id: int) -> Tuple[int, int]:
+        """Get the number of pages and of parent pages for a specific site in one query.
         
         Args:
             site_id: The ID of the site.
-            limit: Maximum number of pages to return.
-            include_chunks: Whether to include chunked content. If False, only parent pages are returned.
             
         Returns:
-            List of pages for the site.
+            A tuple of the total number of pages including chunks and the number of parent pages.
         """
         conn = None
         try:
             conn = self._get_connection()
             cur = conn.cursor()
             
-            # Build the query based on whether to include chunks
-            if include_chunks:
-                query = """
+            # Count all pages and parent pages (not chunks) in a single scan
+            cur.execute(
+                """
+                SELECT COUNT(*), COUNT(*) FILTER (WHERE is_chunk = FALSE)
+                FROM crawl_pages WHERE site_id = %s
+                """,
+                (site_id,)
+            )
+            
+            result = cur.fetchone()
+            return (result[0], result[1]) if result else (0, 0)
+            
+        except Exception as e:
+            print_error(f"Error getting page counts by site ID: {e}")
+            raise
+        finally:
+            if conn:
+                conn.close()
+    
+    def get_site_page_counts(self, include_chunks: bool = False) -> Dict[int, int]:
+        """Get the number of pages for every site in one query.
+        
+        Args:
+            include_chunks: Whether to include chunks in the counts.
+            
+        Returns:
+            A dictionary mapping site IDs to their number of pages. Sites without pages are omitted.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cur = conn.cursor()
+            
+            # Count the pages of all sites at once instead of querying each site
+            cur.execute(
+                """
+                SELECT site_id, COUNT(*) FROM crawl_pages
+                WHERE %s OR is_chunk = FALSE
+                GROUP BY site_id
+                """,
+                (include_chunks,)
+            )
+            
+            return dict(cur.fetchall())
+            
+        except Exception as e:
+            print_error(f"Error getting page counts for sites: {e}")
+            raise
+        finally:
+            if conn:
+                conn.close()
+    
+    def _site_pages_query(self, include_chunks: bool, site_id_sql: str = "%s", after: bool = False) -> str:
+        """Build the query for a site's pages, taking the page limit as a parameter.
+        
+        Pages are ordered by URL, with the chunks of a page by index. The order ends with
+        the page ID and has no NULLs, so it is unique and a batch can start where the
+        last one ended.
+        
+        Args:
+            include_chunks: Whether to include chunked content. If False, only parent pages are selected.
+            site_id_sql: The SQL for the site ID to filter by; a query parameter by default.
+            after: Whether to only select the pages after a position in the order, given by
+                parameters following the site ID (see _site_pages_position).
+            
+        Returns:
+            The SQL query.
+        """
+        if include_chunks:
+            keys = self._site_pages_order(True, "p")
+            position = f"AND ({keys}) > (%s, %s, %s, %s)" if after else ""
+            return f"""
                 SELECT 
                     p.id, p.site_id, p.url, p.title, p.content, p.summary, 
                     p.metadata, p.is_chunk, p.chunk_index, p.parent_id,
@@ -977,13 +1195,14 @@ class SupabaseClient:
                     crawl_pages p
                     LEFT JOIN crawl_pages parent ON p.parent_id = parent.id
                 WHERE 
-                    p.site_id = %s
+                    p.site_id = {site_id_sql} {position}
                 ORDER BY 
-                    p.url, p.is_chunk, p.chunk_index
+                    {keys}
                 LIMIT %s
                 """
-            else:
-                query = """
+        keys = self._site_pages_order(False)
+        position = f"AND ({keys}) > (%s, %s)" if after else ""
+        return f"""
                 SELECT 
                     id, site_id, url, title, content, summary, metadata,
                     created_at, updated_at,
@@ -991,14 +1210,47 @@ class SupabaseClient:
                 FROM 
                     crawl_pages
                 WHERE 
-                    site_id = %s AND
-                    (is_chunk IS NULL OR is_chunk = FALSE)
+                    site_id = {site_id_sql} AND
+                    (is_chunk IS NULL OR is_chunk = FALSE) {position}
                 ORDER BY 
-                    url
+                    {keys}
                 LIMIT %s
                 """
+    
+    @staticmethod
+    def _site_pages_order(include_chunks: bool, table: Optional[str] = None) -> str:
+        """Get the ORDER BY keys of _site_pages_query, optionally qualified with a table alias."""
+        prefix = f"{table}." if table else ""
+        if include_chunks:
+            return f"{prefix}url, COALESCE({prefix}is_chunk, FALSE), COALESCE({prefix}chunk_index, -1), {prefix}id"
+        return f"{prefix}url, {prefix}id"
+    
+    @staticmethod
+    def _site_pages_position(page: Dict[str, Any], include_chunks: bool) -> Tuple:
+        """Get the parameters for selecting the pages after a page with _site_pages_query."""
+        if include_chunks:
+            chunk_index = page['chunk_index']
+            return (page['url'], bool(page['is_chunk']), -1 if chunk_index is None else chunk_index, page['id'])
+        return (page['url'], page['id'])
+    
+    def get_pages_by_site_id(self, site_id: int, limit: int = 100, include_chunks: bool = False) -> List[Dict[str, Any]]:
+        """Get pages for a specific site.
+        
+        Args:
+            site_id: The ID of the site.
+            limit: Maximum number of pages to return.
+            include_chunks: Whether to include chunked content. If False, only parent pages are returned.
             
-            cur.execute(query, (site_id, limit))
+        Returns:
+            List of pages for the site.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cur = conn.cursor()
+            
+            # Build the query based on whether to include chunks
+            cur.execute(self._site_pages_query(include_chunks), (site_id, limit))
             
             # Convert results to dictionaries
             columns = [desc[0] for desc in cur.description]
@@ -1026,6 +1278,139 @@ class SupabaseClient:
             if conn:
                 conn.close()
     
+    def iter_site_pages(self, site_id: int, limit: Optional[int] = None,
+                        include_chunks: bool = False, batch_size: int = 100) -> Iterator[Dict[str, Any]]:
+        """Iterate over the pages of a site without loading them all into memory.
+        
+        The pages are read in batches, each starting after the last page of the one
+        before. A connection is only held while a batch is read, so a slow consumer
+        doesn't keep one out of the pool.
+        
+        Args:
+            site_id: The ID of the site.
+            limit: Maximum number of pages to return, or None for all pages.
+            include_chunks: Whether to include chunked content. If False, only parent pages are returned.
+            batch_size: Number of pages to fetch from the database at a time.
+            
+        Yields:
+            The site's pages, as selected by get_pages_by_site_id.
+        """
+        remaining = limit
+        position = None
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            
+            conn = self._get_connection()
+            try:
+                cur = conn.cursor()
+                if position is None:
+                    cur.execute(self._site_pages_query(include_chunks), (site_id, size))
+                else:
+                    cur.execute(self._site_pages_query(include_chunks, after=True), (site_id, *position, size))
+                columns = [desc[0] for desc in cur.description]
+                pages = [dict(zip(columns, row)) for row in cur.fetchall()]
+            finally:
+                conn.close()
+            
+            yield from pages
+            
+            if len(pages) < size:
+                return
+            if remaining is not None:
+                remaining -= len(pages)
+            position = self._site_pages_position(pages[-1], include_chunks)
+    
+    def get_sites_version(self) -> str:
+        """Get a version string that changes whenever a site is added or updated or a page is added.
+        
+        Returns:
+            A hash of the number of sites, their latest update time and the highest page ID.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cur = conn.cursor()
+            
+            # Pages are only ever inserted, so the highest page ID (read from the primary
+            # key index) changes with every new page
+            cur.execute(
+                """
+                SELECT md5(concat_ws(':', COUNT(*), MAX(updated_at), (SELECT MAX(id) FROM crawl_pages)))
+                FROM crawl_sites
+                """
+            )
+            
+            return cur.fetchone()[0]
+            
+        except Exception as e:
+            print_error(f"Error getting sites version: {e}")
+            raise
+        finally:
+            if conn:
+                conn.close()
+    
+    def get_site_with_pages(self, site_id: int, limit: int = 100,
+                            include_chunks: bool = False) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """Get a site's name together with its pages in one query.
+        
+        Args:
+            site_id: The ID of the site.
+            limit: Maximum number of pages to return.
+            include_chunks: Whether to include chunked content. If False, only parent pages are returned.
+            
+        Returns:
+            A tuple of the site name and the list of pages, or None if the site is not found.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cur = conn.cursor()
+            
+            # Select the same pages as get_pages_by_site_id, joined laterally onto the
+            # site so the limit applies to the pages and a site without pages still
+            # returns a row. The join doesn't keep the subquery's order, so sort again
+            pages_query = self._site_pages_query(include_chunks, site_id_sql="s.id")
+            
+            cur.execute(
+                f"""
+                SELECT s.name AS site_name, p.*
+                FROM crawl_sites s
+                LEFT JOIN LATERAL ({pages_query}) p ON TRUE
+                WHERE s.id = %s
+                ORDER BY {self._site_pages_order(include_chunks, "p")}
+                """,
+                (limit, site_id)
+            )
+            
+            rows = cur.fetchall()
+            if not rows:
+                return None
+            
+            # Convert the page columns to dictionaries, skipping the empty row of a site without pages
+            columns = [desc[0] for desc in cur.description][1:]
+            pages = []
+            
+            for row in rows:
+                if row[1] is None:
+                    continue
+                page_dict = dict(zip(columns, row[1:]))
+                
+                # Convert datetime objects to strings
+                if page_dict['created_at'] is not None and not isinstance(page_dict['created_at'], str):
+                    page_dict['created_at'] = page_dict['created_at'].isoformat()
+                if page_dict['updated_at'] is not None and not isinstance(page_dict['updated_at'], str):
+                    page_dict['updated_at'] = page_dict['updated_at'].isoformat()
+                
+                pages.append(page_dict)
+            
+            return rows[0][0], pages
+        except Exception as e:
+            print_error(f"Error getting site {site_id} with pages: {e}")
+            raise
+        finally:
+            if conn:
+                conn.close()
+    
     def update_site_description(self, site_id: int, description: str) -> bool:
         """Update the description of a site.
         
@@ -1049,6 +1434,7 @@ class SupabaseClient:
             
             cur.execute(update_query, (description, site_id))
             conn.commit()
+            _site_cache.pop(site_id)
             
             return True
             
@@ -1380,6 +1766,10 @@ class SupabaseClient:
         Returns:
             The page with full content, or None if not found.
         """
+        cached = _page_cache.get(page_id)
+        if cached is not None:
+            return dict(cached)
+        
         conn = None
         try:
             conn = self._get_connection()
@@ -1417,8 +1807,9 @@ class SupabaseClient:
                 result['created_at'] = str(result['created_at'])
             if result.get('updated_at') and not isinstance(result['updated_at'], str):
                 result['updated_at'] = str(result['updated_at'])
-                
-            return result
+            
+            _page_cache.set(page_id, result)
+            return dict(result)
             
         except Exception as e:
             print_error(f"Error getting page by ID: {e}")
@@ -1590,14 +1981,15 @@ class SupabaseClient:
             if conn:
                 conn.close()
     
-    def deactivate_user_preference(self, preference_id: int) -> bool:
+    def deactivate_user_preference(self, preference_id: int, user_id: Optional[str] = None) -> bool:
         """Deactivate a user preference.
         
         Args:
             preference_id: The ID of the preference to deactivate.
+            user_id: Optional user ID the preference must belong to.
             
         Returns:
-            True if successful, False otherwise.
+            True if a matching preference was deactivated, False otherwise.
         """
         conn = None
         try:
@@ -1609,9 +2001,9 @@ class SupabaseClient:
                 """
                 UPDATE user_preferences
                 SET is_active = FALSE, updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s
+                WHERE id = %s AND (%s IS NULL OR user_id = %s)
                 """,
-                (preference_id,)
+                (preference_id, user_id, user_id)
             )
             
             conn.commit()
@@ -1625,14 +2017,15 @@ class SupabaseClient:
             if conn:
                 conn.close()
     
-    def activate_user_preference(self, preference_id: int) -> bool:
+    def activate_user_preference(self, preference_id: int, user_id: Optional[str] = None) -> bool:
         """Activate a user preference.
         
         Args:
             preference_id: The ID of the preference to activate.
+            user_id: Optional user ID the preference must belong to.
             
         Returns:
-            True if successful, False otherwise.
+            True if a matching preference was activated, False otherwise.
         """
         conn = None
         try:
@@ -1644,9 +2037,9 @@ class SupabaseClient:
                 """
                 UPDATE user_preferences
                 SET is_active = TRUE, updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s
+                WHERE id = %s AND (%s IS NULL OR user_id = %s)
                 """,
-                (preference_id,)
+                (preference_id, user_id, user_id)
             )
             
             conn.commit()
@@ -1660,14 +2053,15 @@ class SupabaseClient:
             if conn:
                 conn.close()
     
-    def delete_user_preference(self, preference_id: int) -> bool:
+    def delete_user_preference(self, preference_id: int, user_id: Optional[str] = None) -> bool:
         """Delete a user preference.
         
         Args:
             preference_id: The ID of the preference to delete.
+            user_id: Optional user ID the preference must belong to.
             
         Returns:
-            True if successful, False otherwise.
+            True if a matching preference was deleted, False otherwise.
         """
         conn = None
         try:
@@ -1678,13 +2072,13 @@ class SupabaseClient:
             cur.execute(
                 """
                 DELETE FROM user_preferences
-                WHERE id = %s
+                WHERE id = %s AND (%s IS NULL OR user_id = %s)
                 """,
-                (preference_id,)
+                (preference_id, user_id, user_id)
             )
             
             conn.commit()
-            return True
+            return cur.rowcount > 0
             
         except Exception as e:
             print_error(f"Error deleting user preference: {e}")
@@ -1695,6 +2089,84 @@ class SupabaseClient:
             if conn:
                 conn.close()
     
+    def set_user_preferences_active(self, preference_ids: List[int], is_active: bool,
+                                    user_id: Optional[str] = None) -> Optional[List[int]]:
+        """Activate or deactivate several user preferences in one statement.
+        
+        Args:
+            preference_ids: The IDs of the preferences to update.
+            is_active: Whether the preferences should be active.
+            user_id: Optional user ID the preferences must belong to.
+            
+        Returns:
+            The IDs of the preferences that were updated, or None on error.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cur = conn.cursor()
+            
+            # Update the preferences
+            cur.execute(
+                """
+                UPDATE user_preferences
+                SET is_active = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ANY(%s) AND (%s IS NULL OR user_id = %s)
+                RETURNING id
+                """,
+                (is_active, list(preference_ids), user_id, user_id)
+            )
+            updated_ids = [row[0] for row in cur.fetchall()]
+            
+            conn.commit()
+            return updated_ids
+        except Exception as e:
+            print_error(f"Error updating user preferences: {e}")
+            if conn:
+                conn.rollback()
+            return None
+        finally:
+            if conn:
+                conn.close()
+    
+    def delete_user_preferences(self, preference_ids: List[int],
+                                user_id: Optional[str] = None) -> Optional[List[int]]:
+        """Delete several user preferences in one statement.
+        
+        Args:
+            preference_ids: The IDs of the preferences to delete.
+            user_id: Optional user ID the preferences must belong to.
+            
+        Returns:
+            The IDs of the preferences that were deleted, or None on error.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cur = conn.cursor()
+            
+            # Delete the preferences
+            cur.execute(
+                """
+                DELETE FROM user_preferences
+                WHERE id = ANY(%s) AND (%s IS NULL OR user_id = %s)
+                RETURNING id
+                """,
+                (list(preference_ids), user_id, user_id)
+            )
+            deleted_ids = [row[0] for row in cur.fetchall()]
+            
+            conn.commit()
+            return deleted_ids
+        except Exception as e:
+            print_error(f"Error deleting user preferences: {e}")
+            if conn:
+                conn.rollback()
+            return None
+        finally:
+            if conn:
+                conn.close()
+    
     def get_preference_by_id(self, preference_id: int) -> Optional[Dict[str, Any]]:
         """Get a preference by ID.
         
@@ -5,6 +5,7 @@ Script to run the Supa-Crawl-Chat API server.
 
 import uvicorn
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -14,14 +15,25 @@ if __name__ == "__main__":
     # Get port from environment variable or use default
     port = int(os.getenv("API_PORT", "8001"))
     
-    # Run the API server
+    # Auto-reload is for development; set API_RELOAD=false in production
+    reload = os.getenv("API_RELOAD", "true").lower() == "true"
+    workers = 1 if reload else int(os.getenv("API_WORKERS", "1"))
+    
+    # Let each worker size its database pool by the real number of workers
+    os.environ["API_WORKERS"] = str(workers)
+    
+    print(f"API server running at http://localhost:{port}")
+    print(f"API documentation available at http://localhost:{port}/docs")
+    
+    # Run the API server with uvloop and httptools (uvloop is not available on Windows)
     uvicorn.run(
         "api.main:app",
         host="0.0.0.0",
         port=port,
-        reload=True,
-        log_level="info"
+        reload=reload,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=None if reload else workers,
+        access_log=reload,
+        log_level="info" if reload else "warning"
     )
-    
-    print(f"API server running at http://localhost:{port}")
-    print(f"API documentation available at http://localhost:{port}/docs") 
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""
+In-process semantic cache keyed by query embeddings.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class SemanticCache:
+    """Cache values for queries that are semantically similar to earlier ones.
+
+    Entries are grouped by namespace (e.g. profile and user) and by a context
+    key (e.g. a hash of the recent conversation), so a hit only happens when a
+    similar query is asked in the same setting.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: int = 3600, max_entries: int = 1000,
+                 max_namespaces: int = 10000):
+        """Initialize the semantic cache.
+
+        Args:
+            threshold: Minimum cosine similarity for a cache hit.
+            ttl: Time to live for entries in seconds.
+            max_entries: Maximum number of entries kept per namespace.
+            max_namespaces: Maximum number of namespaces kept; the least recently
+                used ones are evicted first.
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_namespaces = max_namespaces
+        self._entries: "OrderedDict[Tuple, List[Tuple[np.ndarray, str, Any, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def context_key(messages: List[Dict[str, Any]], depth: int = 4) -> str:
+        """Hash the last user/assistant messages of a conversation.
+
+        Args:
+            messages: The conversation history.
+            depth: Number of trailing messages to include.
+
+        Returns:
+            A hex digest identifying the conversation context.
+        """
+        recent = [msg for msg in messages if msg.get("role") in ("user", "assistant")][-depth:]
+        digest = hashlib.sha1()
+        for msg in recent:
+            digest.update(msg["role"].encode())
+            digest.update(b"\0")
+            digest.update(str(msg.get("content", "")).encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _live_entries(self, namespace: Tuple, now: float) -> List[Tuple[np.ndarray, str, Any, float]]:
+        """Get the unexpired entries of a namespace, dropping it once nothing is left.
+
+        Must be called with the lock held.
+        """
+        entries = self._entries.get(namespace)
+        if not entries:
+            return []
+        live = [entry for entry in entries if entry[3] > now]
+        if not live:
+            del self._entries[namespace]
+        elif len(live) != len(entries):
+            self._entries[namespace] = live
+        return live
+
+    def get(self, namespace: Tuple, embedding: List[float], context_key: str = "") -> Optional[Any]:
+        """Look up a value for a query embedding.
+
+        Args:
+            namespace: The namespace to search in.
+            embedding: The query embedding.
+            context_key: The conversation context the value must match.
+
+        Returns:
+            The cached value, or None on a miss.
+        """
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        best_value = None
+        best_similarity = self.threshold
+        with self._lock:
+            for vector, key, value, _ in self._live_entries(namespace, now):
+                if key != context_key:
+                    continue
+                similarity = float(np.dot(query, vector))
+                if similarity >= best_similarity:
+                    best_similarity = similarity
+                    best_value = value
+            if best_value is not None:
+                self._entries.move_to_end(namespace)
+        return best_value
+
+    def put(self, namespace: Tuple, embedding: List[float], value: Any,
+            context_key: str = "", ttl: Optional[int] = None):
+        """Store a value for a query embedding.
+
+        Args:
+            namespace: The namespace to store the value in.
+            embedding: The query embedding.
+            value: The value to cache.
+            context_key: The conversation context the value belongs to.
+            ttl: Optional time to live overriding the default.
+        """
+        now = time.monotonic()
+        expires_at = now + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            entries = self._live_entries(namespace, now)
+            entries.append((self._normalize(embedding), context_key, value, expires_at))
+            if len(entries) > self.max_entries:
+                del entries[:len(entries) - self.max_entries]
+            self._entries[namespace] = entries
+            self._entries.move_to_end(namespace)
+            while len(self._entries) > self.max_namespaces:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._entries.clear()
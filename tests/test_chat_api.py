@@ -0,0 +1,354 @@
+"""
+Tests for the chat API router, using in-memory stand-ins for the ChatBot and database.
+
+Run with: python -m pytest tests/test_chat_api.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Add parent directory to path so we can import the API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.routers import chat as chat_router
+
+
+class FakeChatBot:
+    """Records what the chat endpoints do with a session's ChatBot.
+
+    Messages are saved to `store`, a dict of session ID to messages shared by
+    every FakeChatBot, standing in for the conversation history table.
+    """
+
+    def __init__(self, session_id, user_id, profile, log, store):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.profile_name = profile
+        self.model = "test-model"
+        self.search_limit = 5
+        self.result_limit = 5
+        self.similarity_threshold = 0.5
+        self.log = log
+        self.store = store
+        self.conversation_history = []
+        bot = self
+        db = type("DB", (), {
+            "save_message": lambda _, **kwargs: bot._save(kwargs["role"], kwargs["content"]),
+            "get_all_sites": lambda _: [],
+        })()
+        embeddings = type("Embeddings", (), {
+            "generate_embedding": lambda _, text: log.append(("embedding", session_id, text)) or [1.0, 0.0],
+        })()
+        self.crawler = type("Crawler", (), {"db_client": db, "embedding_generator": embeddings})()
+
+    @property
+    def current_profile(self):
+        return self.profile_name
+
+    def _save(self, role, content):
+        self.store.setdefault(self.session_id, []).append(
+            {"role": role, "content": content, "metadata": {"profile": self.profile_name}}
+        )
+
+    def _add(self, role, content):
+        self.conversation_history.append({"role": role, "content": content})
+        self._save(role, content)
+
+    def load_conversation_history(self):
+        self.conversation_history = [dict(msg) for msg in self.store.get(self.session_id, [])]
+
+    def set_profile(self, profile_name):
+        self.profile_name = profile_name
+        self.log.append(("profile", self.session_id, profile_name))
+        if self.conversation_history:
+            self.add_system_message(f"prompt for {profile_name}")
+
+    def add_system_message(self, content):
+        self._add("system", content)
+
+    def add_user_message(self, content):
+        # The real ChatBot extracts and saves the message's preferences here
+        self.log.append(("preferences", self.session_id, content))
+        self._add("user", content)
+
+    def search_for_context(self, query):
+        return [{"url": "https://example.com", "content": "context"}]
+
+    def get_response(self, query, on_token=None):
+        system = [msg["content"] for msg in self.conversation_history if msg["role"] == "system"]
+        self.log.append(("llm", self.session_id, system))
+        self.add_user_message(query)
+        response = f"answer for {self.session_id}"
+        self._add("assistant", response)
+        return response
+
+
+@pytest.fixture
+def log(monkeypatch):
+    log = []
+    bots = {}
+    store = {}
+
+    def fake_chat_bot(model, result_limit, similarity_threshold, session_id, user_id, profile):
+        key = (session_id, user_id, profile)
+        if key not in bots:
+            bots[key] = FakeChatBot(session_id, user_id, profile, log, store)
+        return bots[key]
+
+    monkeypatch.setattr(chat_router, "_get_cached_chat_bot", fake_chat_bot)
+    chat_router.response_cache.clear()
+    chat_router.context_cache.clear()
+    return log
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    return TestClient(app)
+
+
+def test_context_instructions_reach_the_llm(client, log):
+    client.post("/api/chat", json={"message": "what does the site say", "session_id": "s1"})
+
+    llm_calls = [entry for entry in log if entry[0] == "llm"]
+    assert len(llm_calls) == 1
+    assert any(text.startswith("IMPORTANT: You have access") for text in llm_calls[0][2])
+
+
+def test_greetings_anywhere_in_the_message_skip_the_context_search(client, log):
+    client.post("/api/chat", json={"message": "well hi there", "session_id": "s1"})
+
+    assert [entry[0] for entry in log if entry[0] in ("embedding", "llm")] == ["llm"]
+    assert not any(text.startswith("IMPORTANT:") for text in log[-1][2])
+
+
+def test_greeting_words_inside_other_words_are_not_greetings(client, log):
+    client.post("/api/chat", json={"message": "this ship", "session_id": "s1"})
+
+    assert [entry[0] for entry in log if entry[0] in ("embedding", "llm")] == ["embedding", "llm"]
+
+
+def test_anonymous_conversations_share_opening_answers(client, log):
+    first = client.post("/api/chat", json={"message": "what does the site say", "session_id": "s1"}).json()
+    second = client.post("/api/chat", json={"message": "what does the site say", "session_id": "s2"}).json()
+
+    assert first["response"] == second["response"] == "answer for s1"
+    assert len([entry for entry in log if entry[0] == "llm"]) == 1
+
+
+def test_users_do_not_share_cached_answers(client, log):
+    client.post("/api/chat", json={"message": "what does the site say", "session_id": "s1", "user_id": "alice"})
+    second = client.post("/api/chat", json={"message": "what does the site say", "session_id": "s2", "user_id": "bob"}).json()
+
+    assert second["response"] == "answer for s2"
+
+
+def test_follow_ups_skip_the_response_cache(client, log):
+    client.post("/api/chat", json={"message": "what does the site say", "session_id": "s1"})
+    client.post("/api/chat", json={"message": "what does the site say", "session_id": "s1"})
+
+    # The follow-up is answered by the LLM without computing an embedding for the cache
+    assert [entry[0] for entry in log if entry[0] in ("embedding", "llm")] == ["embedding", "llm", "llm"]
+
+
+def test_cache_hit_still_extracts_preferences(client, log):
+    client.post("/api/chat", json={"message": "I love python, what is it", "session_id": "s1"})
+    response = client.post("/api/chat", json={"message": "I love python, what is it", "session_id": "s2"}).json()
+
+    assert response["response"] == "answer for s1"
+    assert len([entry for entry in log if entry[0] == "llm"]) == 1
+    assert [entry for entry in log if entry[0] == "preferences"] == [
+        ("preferences", "s1", "I love python, what is it"),
+        ("preferences", "s2", "I love python, what is it"),
+    ]
+
+
+def test_switching_back_to_a_profile_adds_its_prompt_again(client, log):
+    client.post("/api/chat", json={"message": "what does the site say", "session_id": "s1"})
+    client.post("/api/chat/profiles/expert", params={"session_id": "s1"})
+    client.post("/api/chat/profiles/default", params={"session_id": "s1"})
+    client.post("/api/chat", json={"message": "and what else", "session_id": "s1"})
+
+    # The default ChatBot is reused, but the session used another profile in between
+    assert [entry for entry in log if entry[0] == "profile"] == [
+        ("profile", "s1", "expert"),
+        ("profile", "s1", "default"),
+    ]
+    assert [entry for entry in log if entry[0] == "llm"][-1][2][-1] == "prompt for default"
+
+
+def test_requests_for_a_session_take_turns(log, monkeypatch):
+    active = []
+    overlaps = []
+    get_response = FakeChatBot.get_response
+
+    def slow_get_response(self, query, on_token=None):
+        active.append(self.session_id)
+        if active.count(self.session_id) > 1:
+            overlaps.append(self.session_id)
+        time.sleep(0.05)
+        try:
+            return get_response(self, query, on_token)
+        finally:
+            active.remove(self.session_id)
+
+    monkeypatch.setattr(FakeChatBot, "get_response", slow_get_response)
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+
+    async def send_all():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await asyncio.gather(*(
+                http.post("/api/chat", json={"message": f"question {i}", "session_id": "s1"}, params={"no_cache": True})
+                for i in range(4)
+            ))
+
+    responses = asyncio.run(send_all())
+
+    assert [response.status_code for response in responses] == [200] * 4
+    assert overlaps == []
+    assert chat_router._session_locks == {}
+
+
+def stream_events(client, message):
+    response = client.post("/api/chat/stream", json={"message": message, "session_id": "s1"})
+    return [event for event in response.text.split("\n\n") if event]
+
+
+def test_stream_sends_deltas_then_done(client, log, monkeypatch):
+    def get_response(self, query, on_token=None):
+        on_token("Hello ")
+        on_token("world")
+        return "Hello world"
+
+    monkeypatch.setattr(FakeChatBot, "get_response", get_response)
+    events = stream_events(client, "what does the site say")
+
+    assert events == [
+        'data: {"delta":"Hello "}',
+        'data: {"delta":"world"}',
+        'data: {"done":true,"session_id":"s1","user_id":null}',
+    ]
+
+
+def test_stream_failure_sends_an_error_event(client, log, monkeypatch):
+    def get_response(self, query, on_token=None):
+        on_token("Hello ")
+        raise RuntimeError("rate limited")
+
+    monkeypatch.setattr(FakeChatBot, "get_response", get_response)
+    events = stream_events(client, "what does the site say")
+
+    assert events[0] == 'data: {"delta":"Hello "}'
+    assert events[1].startswith("event: error\ndata: ")
+    assert "rate limited" in events[1]
+    assert events[2].startswith('data: {"done":true')
+    assert chat_router._session_locks == {}
+
+
+class FakePreferenceStore:
+    """Applies bulk preference updates to an in-memory table."""
+
+    def __init__(self, preferences):
+        # ID -> (user ID, is active)
+        self.preferences = dict(preferences)
+        self.fail = False
+
+    def _owned(self, preference_ids, user_id):
+        return [preference_id for preference_id in dict.fromkeys(preference_ids)
+                if preference_id in self.preferences and self.preferences[preference_id][0] == user_id]
+
+    def set_user_preferences_active(self, preference_ids, is_active, user_id=None):
+        if self.fail:
+            return None
+        owned = self._owned(preference_ids, user_id)
+        for preference_id in owned:
+            self.preferences[preference_id] = (user_id, is_active)
+        return owned
+
+    def delete_user_preferences(self, preference_ids, user_id=None):
+        if self.fail:
+            return None
+        owned = self._owned(preference_ids, user_id)
+        for preference_id in owned:
+            del self.preferences[preference_id]
+        return owned
+
+
+@pytest.fixture
+def store():
+    return FakePreferenceStore({1: ("alice", True), 2: ("alice", True), 3: ("bob", True)})
+
+
+@pytest.fixture
+def bulk_client(store):
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.dependency_overrides[chat_router.get_db_client] = lambda: store
+    return TestClient(app)
+
+
+def test_bulk_deactivate_only_changes_the_users_preferences(bulk_client, store):
+    response = bulk_client.post("/api/chat/preferences/bulk/deactivate", params={"user_id": "alice"}, json={"ids": [1, 3, 9]})
+
+    assert response.status_code == 200
+    assert response.json() == {"ids": [1], "missing_ids": [3, 9], "user_id": "alice"}
+    assert store.preferences == {1: ("alice", False), 2: ("alice", True), 3: ("bob", True)}
+
+
+def test_bulk_activate_only_changes_the_users_preferences(bulk_client, store):
+    store.preferences[3] = ("bob", False)
+    response = bulk_client.post("/api/chat/preferences/bulk/activate", params={"user_id": "alice"}, json={"ids": [3, 2]})
+
+    assert response.json() == {"ids": [2], "missing_ids": [3], "user_id": "alice"}
+    assert store.preferences[3] == ("bob", False)
+
+
+def test_bulk_delete_only_removes_the_users_preferences(bulk_client, store):
+    response = bulk_client.post("/api/chat/preferences/bulk/delete", params={"user_id": "bob"}, json={"ids": [1, 3, 3]})
+
+    assert response.json() == {"ids": [3], "missing_ids": [1], "user_id": "bob"}
+    assert sorted(store.preferences) == [1, 2]
+
+
+def test_bulk_update_requires_a_user_and_ids(bulk_client, store):
+    assert bulk_client.post("/api/chat/preferences/bulk/delete", json={"ids": [1]}).status_code == 422
+    assert bulk_client.post("/api/chat/preferences/bulk/delete", params={"user_id": "alice"}, json={"ids": []}).status_code == 422
+    assert len(store.preferences) == 3
+
+
+def test_bulk_update_reports_database_errors(bulk_client, store):
+    store.fail = True
+    response = bulk_client.post("/api/chat/preferences/bulk/activate", params={"user_id": "alice"}, json={"ids": [1]})
+
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Failed to activate preferences"
+
+
+def test_history_is_cached_until_the_session_changes(client, log, monkeypatch):
+    monkeypatch.setattr(chat_router, "_history_cache", chat_router.TTLCache(16, 60))
+    client.post("/api/chat", json={"message": "what does the site say", "session_id": "s1"})
+
+    first = client.get("/api/chat/history", params={"session_id": "s1"}).json()
+    client.post("/api/chat", json={"message": "and what else", "session_id": "s1"})
+    second = client.get("/api/chat/history", params={"session_id": "s1"}).json()
+
+    assert second["count"] == first["count"] + 2
+
+
+def test_chat_bots_load_profiles_from_the_listed_directory(monkeypatch):
+    created = []
+    monkeypatch.setenv("CHAT_PROFILES_DIR", "/custom/profiles")
+    monkeypatch.setattr(chat_router, "ChatBot", lambda **kwargs: created.append(kwargs))
+
+    chat_router._get_cached_chat_bot.__wrapped__(None, None, None, "s1", None, "default")
+
+    assert created[0]["profiles_dir"] == chat_router._profiles_dir() == "/custom/profiles"
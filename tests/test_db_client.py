@@ -0,0 +1,336 @@
+"""
+Tests for the database client, using in-memory stand-ins for psycopg2 connections.
+
+Run with: python -m pytest tests/test_db_client.py
+"""
+
+import os
+import sys
+import threading
+
+import psycopg2.extensions
+import psycopg2.pool
+import pytest
+
+# Add parent directory to path so we can import the client
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db_client
+from db_client import PoolError, SupabaseClient
+
+
+class FakeConnection:
+    """The parts of a psycopg2 connection the pool relies on."""
+
+    def __init__(self):
+        self.closed = 0
+        self.info = type("Info", (), {"transaction_status": psycopg2.extensions.TRANSACTION_STATUS_IDLE})()
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def connect(*args, **kwargs):
+        conn = FakeConnection()
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(psycopg2.pool.psycopg2, "connect", connect)
+    monkeypatch.setattr(db_client, "_pools", {})
+    return opened
+
+
+def make_client(monkeypatch, size, min_size=0, timeout=0.1):
+    monkeypatch.setenv("DB_POOL_SIZE", str(size))
+    monkeypatch.setenv("DB_POOL_MIN_SIZE", str(min_size))
+    monkeypatch.setenv("DB_POOL_TIMEOUT", str(timeout))
+    return SupabaseClient(host="db", port=5432, database="postgres", user="postgres", password="secret")
+
+
+def test_pool_is_shared_between_clients(connections, monkeypatch):
+    first = make_client(monkeypatch, size=2)
+    second = make_client(monkeypatch, size=2)
+
+    assert first._get_pool() is second._get_pool()
+
+
+def test_pool_keeps_min_size_idle_connections(connections, monkeypatch):
+    client = make_client(monkeypatch, size=4, min_size=1)
+    pool = client._get_pool()
+
+    assert pool.minconn == 1
+    assert pool.maxconn == 4
+
+    first = client._get_connection()
+    second = client._get_connection()
+    first.close()
+    second.close()
+
+    # Only min_size connections stay open once they are returned
+    assert sum(not conn.closed for conn in connections) == 1
+
+
+def test_close_returns_connection_to_pool(connections, monkeypatch):
+    client = make_client(monkeypatch, size=1, min_size=1)
+
+    conn = client._get_connection()
+    conn.close()
+    conn.close()
+
+    assert client._get_connection()._conn is connections[0]
+
+
+def test_exhausted_pool_raises_instead_of_connecting(connections, monkeypatch):
+    client = make_client(monkeypatch, size=1)
+
+    client._get_connection()
+    with pytest.raises(PoolError):
+        client._get_connection()
+
+    assert len(connections) == 1
+
+
+def test_exhausted_pool_waits_for_a_returned_connection(connections, monkeypatch):
+    client = make_client(monkeypatch, size=1, timeout=5)
+    conn = client._get_connection()
+
+    timer = threading.Timer(0.1, conn.close)
+    timer.start()
+    try:
+        second = client._get_connection()
+    finally:
+        timer.join()
+
+    assert second._conn is not None
+
+
+def test_default_pool_size_is_split_between_workers(monkeypatch):
+    monkeypatch.setenv("DB_MAX_CONNECTIONS", "40")
+    monkeypatch.setenv("API_WORKERS", "4")
+    assert db_client._default_pool_size() == 10
+
+    monkeypatch.setenv("API_WORKERS", "64")
+    assert db_client._default_pool_size() == 2
+
+    # A process that isn't an API worker, like the CLI, gets the whole budget
+    monkeypatch.delenv("API_WORKERS")
+    assert db_client._default_pool_size() == 40
+
+
+def test_concurrent_hybrid_searches_share_a_small_pool(connections, monkeypatch):
+    client = make_client(monkeypatch, size=1, timeout=5)
+
+    def search_by_embedding(embedding, threshold, limit, site_id):
+        # Each search takes its own connection for its query
+        client._get_connection().close()
+        return [{"url": "https://example.com", "similarity": 0.9}] * limit
+
+    client.search_by_embedding = search_by_embedding
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.hybrid_search("q", [1.0], limit=1)))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [[{"url": "https://example.com", "similarity": 0.9}]] * 2
+
+
+class FakeCursor:
+    """Returns scripted rows and records the statements it executes."""
+
+    def __init__(self, columns, rows, executed):
+        self.description = [(column,) for column in columns]
+        self._rows = rows
+        self._executed = executed
+        self.itersize = None
+
+    def execute(self, query, params=None):
+        self._executed.append((" ".join(query.split()), params))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class FakeDatabase:
+    """A connection stand-in handing out cursors over scripted rows.
+
+    With `batches`, each cursor returns the next batch of rows instead.
+    """
+
+    def __init__(self, columns=(), rows=(), batches=None):
+        self.columns = list(columns)
+        self.rows = list(rows)
+        self.batches = list(batches) if batches is not None else None
+        self.executed = []
+        self.opened = 0
+        self.commits = 0
+        self.closed = 0
+
+    def cursor(self):
+        rows = self.batches.pop(0) if self.batches is not None else self.rows
+        return FakeCursor(self.columns, rows, self.executed)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed += 1
+
+
+def client_with(database):
+    client = SupabaseClient(host="db", port=5432, database="postgres", user="postgres", password="secret")
+
+    def get_connection():
+        database.opened += 1
+        return database
+
+    client._get_connection = get_connection
+    return client
+
+
+class Timestamp:
+    def isoformat(self):
+        return "2024-01-01T00:00:00"
+
+
+def test_get_site_with_pages_returns_name_and_pages():
+    database = FakeDatabase(
+        ["site_name", "id", "url", "created_at", "updated_at"],
+        [("Docs", 1, "https://example.com/a", Timestamp(), None),
+         ("Docs", 2, "https://example.com/b", "2024-01-02", None)],
+    )
+
+    site_name, pages = client_with(database).get_site_with_pages(7, limit=50)
+
+    assert site_name == "Docs"
+    assert pages == [
+        {"id": 1, "url": "https://example.com/a", "created_at": "2024-01-01T00:00:00", "updated_at": None},
+        {"id": 2, "url": "https://example.com/b", "created_at": "2024-01-02", "updated_at": None},
+    ]
+    assert database.executed[0][1] == (50, 7)
+    assert database.closed == 1
+
+
+def test_get_site_with_pages_orders_the_joined_pages():
+    for include_chunks, order in ((False, "ORDER BY p.url, p.id"),
+                                  (True, "ORDER BY p.url, COALESCE(p.is_chunk, FALSE), COALESCE(p.chunk_index, -1), p.id")):
+        database = FakeDatabase(["site_name", "id"], [("Docs", None)])
+
+        client_with(database).get_site_with_pages(7, include_chunks=include_chunks)
+
+        # The outer query sorts in the same order as the lateral page query
+        assert database.executed[0][0].endswith(order)
+
+
+def test_get_site_with_pages_handles_a_site_without_pages():
+    database = FakeDatabase(["site_name", "id", "created_at", "updated_at"], [("Docs", None, None, None)])
+
+    assert client_with(database).get_site_with_pages(7) == ("Docs", [])
+
+
+def test_get_site_with_pages_returns_none_for_a_missing_site():
+    database = FakeDatabase(["site_name", "id"], [])
+
+    assert client_with(database).get_site_with_pages(7) is None
+
+
+def test_iter_site_pages_reads_in_batches():
+    database = FakeDatabase(
+        ["id", "url"],
+        batches=[[(1, "https://example.com/a"), (2, "https://example.com/b")], [(3, "https://example.com/c")]],
+    )
+
+    pages = list(client_with(database).iter_site_pages(7, batch_size=2))
+
+    assert [page["id"] for page in pages] == [1, 2, 3]
+    # The second batch starts after the last page of the first
+    assert database.executed[0][1] == (7, 2)
+    assert "(url, id) > (%s, %s)" in database.executed[1][0]
+    assert database.executed[1][1] == (7, "https://example.com/b", 2, 2)
+    assert database.opened == database.closed == 2
+
+
+def test_iter_site_pages_positions_chunks_by_index():
+    database = FakeDatabase(
+        ["id", "url", "is_chunk", "chunk_index"],
+        batches=[[(1, "https://example.com/a", None, None)], []],
+    )
+
+    list(client_with(database).iter_site_pages(7, include_chunks=True, batch_size=1))
+
+    assert database.executed[1][1] == (7, "https://example.com/a", False, -1, 1, 1)
+
+
+def test_iter_site_pages_stops_at_the_limit():
+    database = FakeDatabase(["id", "url"], batches=[[(1, "a"), (2, "b")], [(3, "c")]])
+
+    pages = list(client_with(database).iter_site_pages(7, limit=3, batch_size=2))
+
+    assert [page["id"] for page in pages] == [1, 2, 3]
+    assert database.executed[1][1][-1] == 1
+    assert len(database.executed) == 2
+
+
+def test_abandoned_iter_site_pages_returns_its_connection():
+    database = FakeDatabase(["id", "url"], batches=[[(1, "a"), (2, "b")], [(3, "c")]])
+
+    pages = client_with(database).iter_site_pages(7, batch_size=2)
+    next(pages)
+
+    # The connection is back while the consumer holds the iterator, and no more are taken
+    assert database.opened == database.closed == 1
+    del pages
+    assert database.opened == database.closed == 1
+
+
+def test_set_user_preferences_active_filters_by_user():
+    database = FakeDatabase(["id"], [(1,), (3,)])
+
+    updated = client_with(database).set_user_preferences_active([1, 2, 3], False, "alice")
+
+    assert updated == [1, 3]
+    query, params = database.executed[0]
+    assert query.startswith("UPDATE user_preferences")
+    assert params == (False, [1, 2, 3], "alice", "alice")
+    assert database.commits == 1
+
+
+def test_delete_user_preferences_filters_by_user():
+    database = FakeDatabase(["id"], [(2,)])
+
+    deleted = client_with(database).delete_user_preferences((2, 4), "alice")
+
+    assert deleted == [2]
+    query, params = database.executed[0]
+    assert query.startswith("DELETE FROM user_preferences")
+    assert params == ([2, 4], "alice", "alice")
+    assert database.commits == 1
+
+
+def test_bulk_preference_updates_return_none_on_error():
+    class BrokenDatabase(FakeDatabase):
+        def cursor(self, name=None):
+            raise RuntimeError("connection lost")
+
+    assert client_with(BrokenDatabase()).set_user_preferences_active([1], True, "alice") is None
+    assert client_with(BrokenDatabase()).delete_user_preferences([1], "alice") is None
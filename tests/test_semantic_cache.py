@@ -0,0 +1,107 @@
+"""
+Tests for the in-process semantic cache.
+
+Run with: python -m pytest tests/test_semantic_cache.py
+"""
+
+import os
+import sys
+import time
+
+# Add parent directory to path so we can import semantic_cache
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from semantic_cache import SemanticCache
+
+
+def test_hit_for_similar_query():
+    cache = SemanticCache(threshold=0.95)
+    cache.put(("default", "u"), [1.0, 0.0], "answer")
+
+    assert cache.get(("default", "u"), [1.0, 0.01]) == "answer"
+
+
+def test_miss_for_dissimilar_query():
+    cache = SemanticCache(threshold=0.95)
+    cache.put(("default", "u"), [1.0, 0.0], "answer")
+
+    assert cache.get(("default", "u"), [0.0, 1.0]) is None
+
+
+def test_returns_most_similar_entry():
+    cache = SemanticCache(threshold=0.5)
+    cache.put(("ns",), [1.0, 0.0], "first")
+    cache.put(("ns",), [0.8, 0.6], "second")
+
+    assert cache.get(("ns",), [0.79, 0.61]) == "second"
+
+
+def test_namespaces_are_isolated():
+    cache = SemanticCache()
+    cache.put(("default", "alice"), [1.0, 0.0], "alice's answer")
+
+    assert cache.get(("default", "bob"), [1.0, 0.0]) is None
+    assert cache.get(("other", "alice"), [1.0, 0.0]) is None
+
+
+def test_context_keys_are_isolated():
+    cache = SemanticCache()
+    history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    cache.put(("ns",), [1.0, 0.0], "answer", SemanticCache.context_key(history))
+
+    assert cache.get(("ns",), [1.0, 0.0], SemanticCache.context_key([])) is None
+    assert cache.get(("ns",), [1.0, 0.0], SemanticCache.context_key(history)) == "answer"
+
+
+def test_context_key_ignores_system_messages():
+    history = [{"role": "user", "content": "hi"}]
+    with_system = [{"role": "system", "content": "be brief"}] + history
+
+    assert SemanticCache.context_key(history) == SemanticCache.context_key(with_system)
+
+
+def test_entries_expire():
+    cache = SemanticCache(ttl=60)
+    cache.put(("ns",), [1.0, 0.0], "answer", ttl=0.05)
+    time.sleep(0.1)
+
+    assert cache.get(("ns",), [1.0, 0.0]) is None
+    assert ("ns",) not in cache._entries
+
+
+def test_lookups_do_not_create_namespaces():
+    cache = SemanticCache()
+    for user in range(100):
+        cache.get(("default", user), [1.0, 0.0])
+
+    assert len(cache._entries) == 0
+
+
+def test_entries_per_namespace_are_capped():
+    cache = SemanticCache(threshold=0.99, max_entries=2)
+    cache.put(("ns",), [1.0, 0.0], "oldest")
+    cache.put(("ns",), [0.0, 1.0], "middle")
+    cache.put(("ns",), [-1.0, 0.0], "newest")
+
+    assert cache.get(("ns",), [1.0, 0.0]) is None
+    assert cache.get(("ns",), [-1.0, 0.0]) == "newest"
+
+
+def test_least_recently_used_namespace_is_evicted():
+    cache = SemanticCache(max_namespaces=2)
+    cache.put(("a",), [1.0, 0.0], "a")
+    cache.put(("b",), [1.0, 0.0], "b")
+    # A hit keeps "a" in use, so "b" is the one evicted
+    assert cache.get(("a",), [1.0, 0.0]) == "a"
+    cache.put(("c",), [1.0, 0.0], "c")
+
+    assert cache.get(("b",), [1.0, 0.0]) is None
+    assert cache.get(("a",), [1.0, 0.0]) == "a"
+    assert cache.get(("c",), [1.0, 0.0]) == "c"
+
+
+def test_clear():
+    cache = SemanticCache()
+    cache.put(("ns",), [1.0, 0.0], "answer")
+    cache.clear()
+
+    assert cache.get(("ns",), [1.0, 0.0]) is None
@@ -3,6 +3,7 @@ Utility functions for the CLI.
 """
 
 import os
+import time
 from typing import List, Dict, Any, Optional
 from rich.console import Console
 from rich.table import Table
@@ -116,4 +117,21 @@ def get_rich_progress():
         BarColumn(),
         TaskProgressColumn(),
         console=console
-    ) 
\ No newline at end of file
+    ) 
+
+def new_session_id() -> str:
+    """Generate a time-ordered session ID (a UUIDv7 as 32 hex characters).
+    
+    New IDs sort after older ones, so new sessions are appended to the end of
+    the session_id index rather than scattered across it.
+    
+    Returns:
+        The session ID.
+    """
+    # 48-bit millisecond timestamp followed by 80 random bits
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    
+    # Set the version (7) and variant (RFC 4122) bits
+    value = (value & ~(0xF << 76)) | (0x7 << 76)
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)
+    return f"{value:032x}"